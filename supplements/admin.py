@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import ProteinPowder, Creatine, Brand
+from .models import ProteinPowder, Creatine, Brand, PriceObservation
 
 
 class ProteinPowderAdmin(admin.ModelAdmin):
@@ -11,6 +11,13 @@ class CreatineAdmin(admin.ModelAdmin):
     list_display = ["name", "weight", "brand", "form", "type", "url"]
 
 
+class PriceObservationAdmin(admin.ModelAdmin):
+    list_display = ["product", "price", "observed_at", "source"]
+    list_filter = ["content_type", "source"]
+    date_hierarchy = "observed_at"
+
+
 admin.site.register(ProteinPowder, ProteinPowderAdmin)
 admin.site.register(Creatine, CreatineAdmin)
 admin.site.register(Brand)
+admin.site.register(PriceObservation, PriceObservationAdmin)
@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import defaultdict
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CatalogVersion
+
+VERSION_KEY = 'catalog:version'
+# How long a process trusts its cached copy of the catalog version. A bump
+# reaches every page within this many seconds.
+VERSION_TTL = getattr(settings, 'CATALOG_VERSION_TTL', 5)
+PAGE_TTL = getattr(settings, 'CATALOG_PAGE_TTL', 60 * 60 * 24)
+# Hit and miss counts are written to the cache in batches of this many, or
+# at least this often, in seconds.
+STATS_BATCH = 50
+STATS_INTERVAL = 30
+
+
+def catalog_state():
+    """The current (version, updated_at) of the catalog; (0, None) before the first bump."""
+    state = cache.get(VERSION_KEY)
+    if state is None:
+        state = CatalogVersion.objects.values_list('version', 'updated_at').first() or (0, None)
+        cache.set(VERSION_KEY, state, VERSION_TTL)
+    return state
+
+
+def catalog_version():
+    return catalog_state()[0]
+
+
+def bump_catalog_version():
+    updated = CatalogVersion.objects.filter(pk=1).update(version=F('version') + 1, updated_at=timezone.now())
+    if not updated:
+        CatalogVersion.objects.create(pk=1, version=1)
+    cache.delete(VERSION_KEY)
+
+
+class StatsCounter:
+    """
+    Hit and miss counts added up in the process and written to the cache
+    every STATS_BATCH events or STATS_INTERVAL seconds, so a hit does not
+    write to the cache on the read path.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pending = defaultdict(int)
+        self.flushed_at = time.monotonic()
+
+    def count(self, kind, outcome):
+        with self._lock:
+            self.pending[kind, outcome] += 1
+            due = sum(self.pending.values()) >= STATS_BATCH or time.monotonic() - self.flushed_at >= STATS_INTERVAL
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self.pending = self.pending, defaultdict(int)
+            self.flushed_at = time.monotonic()
+        for (kind, outcome), n in pending.items():
+            key = f'catalog:stats:{kind}:{outcome}'
+            cache.add(key, 0, None)
+            try:
+                cache.incr(key, n)
+            except ValueError:
+                cache.set(key, n, None)
+
+
+stats_counter = StatsCounter()
+count = stats_counter.count
+
+
+def is_process_local():
+    """Whether the cache, and so its hit and miss counters, lives inside each process."""
+    return isinstance(caches[DEFAULT_CACHE_ALIAS], (LocMemCache, DummyCache))
+
+
+def cache_stats():
+    """
+    Hit and miss counters per cache kind. They are shared by every process
+    using a shared backend (CACHE_DIR, or a cache server). With the default
+    local-memory cache each process only sees its own. They are approximate:
+    other processes' unflushed counts are missing, and the file cache's incr
+    is not atomic across processes.
+    """
+    stats_counter.flush()
+    stats = {}
+    for kind in ('page', 'fragment'):
+        stats[kind] = {outcome: cache.get(f'catalog:stats:{kind}:{outcome}', 0) for outcome in ('hit', 'miss')}
+    return stats
+
+
+def cached_on_catalog(view):
+    """
+    Cache a view's GET responses under the current catalog version and the
+    request path, so they stay valid until the next price write.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view(request, *args, **kwargs)
+
+        key = f'catalog:page:{catalog_version()}:{request.get_full_path()}'
+        response = cache.get(key)
+        if response is not None:
+            count('page', 'hit')
+            return response
+
+        count('page', 'miss')
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200:
+            if hasattr(response, 'render') and callable(response.render):
+                response.add_post_render_callback(lambda r: cache.set(key, r, PAGE_TTL))
+            else:
+                cache.set(key, response, PAGE_TTL)
+        return response
+
+    return wrapper
@@ -0,0 +1,61 @@
+from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
+
+from .models import DailyPrice, PriceObservation
+
+
+def record_price_changes(changes, observed_at=None):
+    """
+    Store price history for `changes`, an iterable of
+    (product, old_price, new_price, source) tuples: one PriceObservation per
+    change, and the day's DailyPrice row widened to cover both the old and
+    the new price. Callers only pass prices that actually changed.
+    """
+    changes = list(changes)
+    if not changes:
+        return
+
+    observed_at = observed_at or timezone.now()
+    day = timezone.localdate(observed_at)
+    content_types = ContentType.objects.get_for_models(*{type(product) for product, *_ in changes})
+
+    PriceObservation.objects.bulk_create([
+        PriceObservation(
+            content_type=content_types[type(product)],
+            object_id=product.pk,
+            price=new_price,
+            observed_at=observed_at,
+            source=source,
+        )
+        for product, old_price, new_price, source in changes
+    ])
+
+    existing = {
+        (daily.content_type_id, daily.object_id): daily
+        for daily in DailyPrice.objects.filter(
+            day=day,
+            content_type__in=content_types.values(),
+            object_id__in={product.pk for product, *_ in changes},
+        )
+    }
+    created = {}
+    for product, old_price, new_price, source in changes:
+        key = (content_types[type(product)].id, product.pk)
+        daily = existing.get(key) or created.get(key)
+        if daily is None:
+            opening = new_price if old_price is None else old_price
+            daily = DailyPrice(
+                content_type_id=key[0],
+                object_id=key[1],
+                day=day,
+                min_price=min(opening, new_price),
+                max_price=max(opening, new_price),
+            )
+            created[key] = daily
+        daily.min_price = min(daily.min_price, new_price)
+        daily.max_price = max(daily.max_price, new_price)
+        daily.close_price = new_price
+
+    DailyPrice.objects.bulk_create(created.values())
+    if existing:
+        DailyPrice.objects.bulk_update(existing.values(), ['min_price', 'max_price', 'close_price'])
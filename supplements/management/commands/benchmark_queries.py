@@ -0,0 +1,134 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from supplements.models import (
+    Brand,
+    Creatine,
+    ProteinPowder,
+    CREATINE_FORM_CHOICES,
+    CREATINE_TYPE_CHOICES,
+    PROTEIN_TYPE_CHOICES,
+)
+from supplements.rankings import ranked_queryset
+
+DEFAULT_ROWS = 100_000
+DEFAULT_REPEAT = 20
+BRANDS = 200
+NAMES_PER_BRAND = 20
+WEIGHTS = (250, 500, 908, 1000, 2000, 2270, 2500, 4000, 5000)
+# The composite indexes being measured; every other index stays in place.
+BENCHMARKED_INDEXES = {
+    ProteinPowder: ('protein_ranking_idx',),
+    Creatine: ('creatine_ranking_idx',),
+}
+
+
+class Rollback(Exception):
+    pass
+
+
+def synthetic_catalog(rows, seed=0):
+    """`rows` protein powders and `rows` creatines spread over BRANDS brands."""
+    rng = random.Random(seed)
+    brands = Brand.objects.bulk_create([
+        Brand(name=f"Bench {i}", code=f"bench_{i}", website_url=f"https://bench{i}.pt") for i in range(BRANDS)
+    ])
+
+    def products(model, **choices):
+        for i in range(rows):
+            product = model(
+                name=f"Product {rng.randrange(NAMES_PER_BRAND)}",
+                brand=rng.choice(brands),
+                weight=rng.choice(WEIGHTS),
+                price=f"{rng.uniform(5, 120):.2f}",
+                image='bench.png',
+                url=f"https://bench.pt/{model._meta.model_name}/{i}",
+                **{field: rng.choice(values)[0] for field, values in choices.items()},
+            )
+            product.update_derived_prices()
+            yield product
+
+    ProteinPowder.objects.bulk_create(products(ProteinPowder, type=PROTEIN_TYPE_CHOICES), batch_size=1000)
+    Creatine.objects.bulk_create(
+        products(Creatine, type=CREATINE_TYPE_CHOICES, form=CREATINE_FORM_CHOICES), batch_size=1000
+    )
+    return brands
+
+
+def benchmark_queries():
+    """The queries the ranking pages and the home page run."""
+    return [
+        ('protein ranking', lambda: ranked_queryset(ProteinPowder.objects.filter(type='isolate'))),
+        ('creatine ranking', lambda: ranked_queryset(Creatine.objects.filter(type='creapure', form='capsules'))),
+        ('home page', lambda: ProteinPowder.objects.order_by('price_per_kg', 'pk')[:20]),
+    ]
+
+
+def time_query(build, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        list(build())
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def set_indexes(enabled):
+    """
+    Create or drop the benchmarked indexes with plain SQL. The schema editor
+    itself cannot be entered inside the benchmark's transaction on SQLite.
+    """
+    editor = connection.schema_editor()
+    with connection.cursor() as cursor:
+        for model, names in BENCHMARKED_INDEXES.items():
+            for index in model._meta.indexes:
+                if index.name not in names:
+                    continue
+                if enabled:
+                    cursor.execute(str(index.create_sql(model, editor)))
+                else:
+                    cursor.execute(f"DROP INDEX {connection.ops.quote_name(index.name)}")
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare query plans and timings of the catalog queries with and without the composite '
+        'indexes, on a synthetic catalog that is rolled back afterwards'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=DEFAULT_ROWS, help='Synthetic products per model')
+        parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='Runs per query; the median is reported')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['rows'], options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, rows, repeat):
+        started = time.perf_counter()
+        synthetic_catalog(rows)
+        self.stdout.write(f"Created {rows} protein powders and {rows} creatines in {time.perf_counter() - started:.1f}s")
+        queries = benchmark_queries()
+
+        results = {}
+        for label, enabled in (('before', False), ('after', True)):
+            set_indexes(enabled)
+            for name, build in queries:
+                results[name, label] = (build().explain(), time_query(build, repeat))
+
+        for name, _ in queries:
+            (plan_before, before), (plan_after, after) = results[name, 'before'], results[name, 'after']
+            speedup = before / after if after else float('inf')
+            self.stdout.write(f"{name}: {before:.2f}ms -> {after:.2f}ms ({speedup:.1f}x)")
+            for label, plan in (('before', plan_before), ('after', plan_after)):
+                self.stdout.write(f"  plan {label}:")
+                for line in plan.splitlines():
+                    self.stdout.write(f"    {line}")
@@ -0,0 +1,141 @@
+import statistics
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from supplements.rankings import rebuild_ranking_snapshots
+from supplements.scraping.parsing import BACKENDS, HtmlParser, available_backends, read_prices
+from supplements.scraping.pool import BrowserPool, ScrapeJob
+from supplements.scraping.registry import REGISTRY_PATH, compile_plan, load_registry
+from supplements.scraping.replay import PageStore, ReplayFetcher, ReplaySession
+from supplements.scraping.writer import PriceWriter
+
+from .update_product_prices import DEFAULT_WORKERS, update_price
+
+DEFAULT_REPEAT = 5
+
+
+class Rollback(Exception):
+    pass
+
+
+def parser_variants():
+    """
+    Every installed backend, on the whole page and on the markup price
+    selectors read, starting from html.parser on the whole page.
+    """
+    return [HtmlParser(backend, subtree) for backend in reversed(available_backends()) for subtree in (False, True)]
+
+
+def parser_costs(store, parsers, repeat):
+    """
+    Per retailer: pages, average page size in kB, the median parse time per
+    page in ms for each parser, and how many pages each parser read
+    different prices off than the first one.
+    """
+    pages = defaultdict(int)
+    sizes = defaultdict(float)
+    timings = defaultdict(lambda: defaultdict(float))
+    disagreements = defaultdict(lambda: defaultdict(int))
+    for meta, html in store.pages():
+        job = store.job(meta)
+        pages[job.retailer] += 1
+        sizes[job.retailer] += len(html.encode('utf-8')) / 1024
+        expected = None
+        for parser in parsers:
+            runs = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                prices = read_prices(html, job, parser, warn=False)
+                runs.append((time.perf_counter() - started) * 1000)
+            timings[job.retailer][str(parser)] += statistics.median(runs)
+            if expected is None:
+                expected = prices
+            elif prices != expected:
+                disagreements[job.retailer][str(parser)] += 1
+    return {
+        retailer: (
+            pages[retailer],
+            sizes[retailer] / pages[retailer],
+            {name: total / pages[retailer] for name, total in timings[retailer].items()},
+            dict(disagreements[retailer]),
+        )
+        for retailer in sorted(pages)
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the price updater offline against pages saved with update_product_prices --capture: '
+        'parser cost per retailer, then the whole pipeline in a transaction that is rolled back'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('pages', help='Directory the pages were captured to')
+        parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='Parses per page; the median is reported')
+        parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Pool workers for the pipeline run')
+        parser.add_argument(
+            '--parser', choices=['auto', *BACKENDS], default='auto', help='HTML parser for the pipeline run',
+        )
+        parser.add_argument('--registry', default=REGISTRY_PATH, help='Retailer registry JSON to resolve products from')
+
+    def handle(self, *args, **options):
+        store = PageStore(options['pages'])
+        if not store.root.is_dir():
+            raise CommandError(f"No captured pages in {store.root}")
+
+        parsers = parser_variants()
+        costs = parser_costs(store, parsers, options['repeat'])
+        if not costs:
+            raise CommandError(f"No captured pages in {store.root}")
+        self.stdout.write(f"Parser cost over {sum(pages for pages, *_ in costs.values())} pages, in ms/page")
+        for retailer, (pages, kb, timings, disagreements) in costs.items():
+            self.stdout.write(f"  {retailer}: {pages} pages, {kb:.0f}kB/page")
+            baseline = timings[str(parsers[0])]
+            for name, ms in timings.items():
+                speedup = baseline / ms if ms else float('inf')
+                differs = f", different prices on {disagreements[name]} pages" if name in disagreements else ""
+                self.stdout.write(f"    {name}: {ms:.2f}ms ({speedup:.1f}x){differs}")
+
+        plan = compile_plan(load_registry(options['registry']))
+        parser = HtmlParser(options['parser'])
+        try:
+            with transaction.atomic():
+                self.pipeline(store, plan, parser, options['workers'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def pipeline(self, store, plan, parser, workers):
+        """Resolve, fetch from the store, write and rebuild the rankings, as update_product_prices would."""
+        started = time.perf_counter()
+        fetches, _ = plan.resolve()
+        pool = BrowserPool(ReplaySession, workers=workers, retailer_limits=plan.concurrency)
+        skipped = set()
+        for retailer, product, selectors in fetches:
+            click_selector, skip_selectors = selectors.get('click_selector'), selectors.get('skip_selectors')
+            if store.has(retailer, product.url, click_selector, skip_selectors):
+                pool.submit(retailer, product, **selectors)
+            else:
+                skipped.add(ScrapeJob.page_key(retailer, product.url, click_selector, skip_selectors))
+
+        fetcher = ReplayFetcher(store, parser, plan)
+        writer = PriceWriter()
+        products = found = 0
+        for target, price in pool.run(fetcher):
+            products += 1
+            found += price is not None
+            update_price(writer, target, price)
+        writer.flush()
+        rebuild_ranking_snapshots()
+
+        elapsed = time.perf_counter() - started
+        throughput = products / elapsed if elapsed else 0.0
+        self.stdout.write(
+            f"Pipeline: {products} products ({found} priced) from {pool.summary.total_pages} pages "
+            f"in {elapsed:.2f}s ({throughput:.1f} products/s, {fetcher.parse_seconds:.2f}s parsing with {parser})"
+        )
+        self.stdout.write(f"  {len(skipped)} pages in the plan were never captured")
+        self.stdout.write(f"  {writer.updated} prices would change; rolled back")
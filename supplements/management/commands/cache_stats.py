@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from supplements.cache import cache_stats, catalog_version, is_process_local
+
+
+class Command(BaseCommand):
+    help = 'Show page and fragment cache hit rates for the current cache backend'
+
+    def handle(self, *args, **options):
+        if is_process_local():
+            raise CommandError(
+                "The cache is local to each process, so the web server's hits and misses cannot be read from "
+                "here. Set CACHE_DIR (or configure a shared cache) to collect them."
+            )
+        self.stdout.write(f"Catalog version {catalog_version()} (counts are approximate)")
+        for kind, counts in cache_stats().items():
+            total = counts['hit'] + counts['miss']
+            hit_rate = counts['hit'] / total * 100 if total else 0.0
+            self.stdout.write(f"  {kind}: {counts['hit']} hits, {counts['miss']} misses ({hit_rate:.0f}% hit rate)")
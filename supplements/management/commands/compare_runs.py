@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from supplements.models import ScrapeRun
+from supplements.scraping.telemetry import retailer_summary, summary_lines
+
+RECENT_RUNS = 10
+
+
+def change(before, after):
+    if not before:
+        return ''
+    return f" ({(after - before) / before * 100:+.0f}%)"
+
+
+class Command(BaseCommand):
+    help = 'Compare per-retailer fetch latency, page weight and selector hit rate between two scrape runs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'runs',
+            nargs='*',
+            type=int,
+            help='Ids of the baseline and the candidate run (default: the two latest runs)',
+        )
+        parser.add_argument(
+            '--list',
+            action='store_true',
+            help=f'List the {RECENT_RUNS} latest runs instead',
+        )
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for run in ScrapeRun.objects.order_by('-started_at', '-pk')[:RECENT_RUNS]:
+                self.stdout.write(f"{run.pk}: {run.started_at:%Y-%m-%d %H:%M}, {run.pages} pages, {run.workers} workers")
+            return
+
+        if options['runs']:
+            if len(options['runs']) != 2:
+                raise CommandError("Pass two run ids, or none to compare the two latest runs.")
+            runs = {run.pk: run for run in ScrapeRun.objects.filter(pk__in=options['runs'])}
+            missing = [pk for pk in options['runs'] if pk not in runs]
+            if missing:
+                raise CommandError(f"No scrape run with id {', '.join(map(str, missing))}.")
+            baseline, candidate = (runs[pk] for pk in options['runs'])
+        else:
+            latest = list(ScrapeRun.objects.order_by('-started_at', '-pk')[:2])
+            if len(latest) < 2:
+                raise CommandError("Need at least two scrape runs to compare.")
+            candidate, baseline = latest
+
+        for run in (baseline, candidate):
+            for line in summary_lines(run):
+                self.stdout.write(line)
+
+        before, after = retailer_summary(baseline), retailer_summary(candidate)
+        self.stdout.write(f"Run {baseline.pk} -> run {candidate.pk}")
+        for retailer in sorted(set(before) | set(after)):
+            if retailer not in before or retailer not in after:
+                self.stdout.write(f"  {retailer}: only in run {(candidate if retailer in after else baseline).pk}")
+                continue
+            a, b = before[retailer], after[retailer]
+            self.stdout.write(
+                f"  {retailer}: p50 {a['p50_ms']} -> {b['p50_ms']}ms{change(a['p50_ms'], b['p50_ms'])}, "
+                f"p95 {a['p95_ms']} -> {b['p95_ms']}ms{change(a['p95_ms'], b['p95_ms'])}, "
+                f"parse p50 {a['parse_p50_ms']} -> {b['parse_p50_ms']}ms{change(a['parse_p50_ms'], b['parse_p50_ms'])}, "
+                f"{a['kb_per_page']:.0f} -> {b['kb_per_page']:.0f} kB/page, "
+                f"selectors found {a['hit_rate']:.0f}% -> {b['hit_rate']:.0f}%"
+            )
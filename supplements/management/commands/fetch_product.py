@@ -1,65 +1,189 @@
+import asyncio
+import json
 import logging
-from bs4 import BeautifulSoup
-from playwright.sync_api import sync_playwright
-from django.core.management.base import BaseCommand
+import sys
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError, async_playwright
+from django.core.management.base import BaseCommand, CommandError
 
 from supplements.models import Creatine
+from supplements.scraping.blocking import DEFAULT_RULES, BlockStats, PageResources
+from supplements.scraping.parsing import EXTRACT_FUNCTION
+from supplements.scraping.prices import parse_price
+from supplements.scraping.registry import compile_plan, load_registry
+from supplements.scraping.waits import DEFAULT_TIMEOUTS, PhaseTimer, TimeoutProfile
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+DEFAULT_CONCURRENCY = 8
+PRODUCT_SELECTORS = {
+    'prozis': {
+        'selectors': {
+            'name': 'h1.product-name',
+            'brand': 'h2.product-brand',
+            'price': 'span.price',
+            'weight': 'span.weight',
+        },
+        'click_selector': 'a.btn-primary',
+        'timeouts': TimeoutProfile(element=8),
+    },
+}
+
 
-def playwright_request(url, click_selector=None, skip_selectors=None, timeout=4000):
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=False)
-        page = browser.new_page()
-        page.goto(url)
-        page.wait_for_timeout(timeout)
+async def wait_until_idle(page, timeouts):
+    try:
+        await page.wait_for_load_state('networkidle', timeout=timeouts.ms('settle'))
+    except PlaywrightTimeoutError:
+        pass
+
+
+async def block_resources(page, rules, resources):
+    async def handle(route):
+        request = route.request
+        if rules.should_block(request.url, request.resource_type):
+            resources.block(request.resource_type)
+            await route.abort()
+        else:
+            await route.continue_()
+
+    def loaded(response):
+        resources.load(int(response.headers.get('content-length') or 0))
+
+    page.on('response', loaded)
+    await page.route('**/*', handle)
+
+
+async def playwright_extract(context, url, selectors, click_selector=None, skip_selectors=None,
+                             timeouts=DEFAULT_TIMEOUTS, timer=None, rules=DEFAULT_RULES, resources=None):
+    """
+    Load `url` in a new page of `context` and, once every one of the
+    {field: selector} `selectors` is attached and the network has gone
+    quiet, return {field: text} read inside the page in one call (None where
+    nothing matched). Waits end as soon as the page is ready and never run
+    past the TimeoutProfile. Requests matched by `rules` are aborted and
+    counted in `resources`.
+    """
+    timer = timer or PhaseTimer().bind(url)
+    page = await context.new_page()
+    if rules:
+        await block_resources(page, rules, resources or PageResources())
+    try:
+        with timer.measure('navigation'):
+            await page.goto(url, wait_until='domcontentloaded', timeout=timeouts.ms('page_load'))
+        with timer.measure('wait'):
+            await wait_until_idle(page, timeouts)
 
         if skip_selectors:
             for skip_selector in skip_selectors:
                 try:
-                    page.locator(skip_selector).click()
-                    page.wait_for_timeout(timeout)
+                    with timer.measure('wait'):
+                        await page.locator(skip_selector).first.wait_for(timeout=timeouts.ms('optional'))
+                    with timer.measure('work'):
+                        await page.locator(skip_selector).first.click(timeout=timeouts.ms('element'))
+                except PlaywrightTimeoutError:
+                    logger.info(f"Skip element with selector {skip_selector} did not show up.")
                 except Exception as e:
                     logger.warning(f"Could not click skip element with selector {skip_selector}: {e}")
 
         if click_selector:
             try:
-                page.locator(click_selector).click()
-                page.wait_for_timeout(timeout)
+                with timer.measure('work'):
+                    await page.locator(click_selector).first.click(timeout=timeouts.ms('element'))
+                with timer.measure('wait'):
+                    await wait_until_idle(page, timeouts)
             except Exception as e:
                 logger.warning(f"Could not click element with selector {click_selector}: {e}")
 
-        html = page.content()
-        page.close()
-        return BeautifulSoup(html, 'html.parser')
+        with timer.measure('wait'):
+            for selector in selectors.values():
+                try:
+                    await page.wait_for_selector(selector, state='attached', timeout=timeouts.ms('element'))
+                except PlaywrightTimeoutError:
+                    logger.info(f"Selector {selector} did not show up on {url}.")
+                    break
+
+        with timer.measure('work'):
+            return await page.evaluate(EXTRACT_FUNCTION, selectors)
+    finally:
+        await page.close()
 
 
-def fetch_product_data(url, selectors, click_selector=None, skip_selectors=None):
+async def fetch_product_data(context, url, selectors, click_selector=None, skip_selectors=None,
+                             timeouts=DEFAULT_TIMEOUTS, timer=None, rules=DEFAULT_RULES, resources=None):
     try:
-        soup = playwright_request(url, click_selector, skip_selectors)
+        texts = await playwright_extract(
+            context,
+            url,
+            selectors,
+            click_selector,
+            skip_selectors,
+            timeouts=timeouts,
+            timer=timer,
+            rules=rules,
+            resources=resources,
+        )
         product_data = {}
 
-        for field, selector in selectors.items():
-            element = soup.select_one(selector)
-            if not element:
-                logger.warning(f"{field.capitalize()} element not found on the page.")
+        for field in selectors:
+            text = texts.get(field)
+            if text is None:
+                logger.warning(f"{field.capitalize()} element not found on {url}.")
                 product_data[field] = None
             else:
-                product_data[field] = element.get_text().strip()
+                product_data[field] = text.strip()
 
         return product_data
     except Exception as e:
-        logger.error(f"An error occurred: {e}")
+        logger.error(f"An error occurred on {url}: {e}")
         return None
 
 
+async def fetch_products(urls, selectors, click_selector=None, skip_selectors=None, timeouts=DEFAULT_TIMEOUTS,
+                         timer=None, rules=DEFAULT_RULES, block_stats=None, retailer=None,
+                         concurrency=DEFAULT_CONCURRENCY, headless=False):
+    """
+    Fetch every URL with one shared browser and context, keeping up to
+    `concurrency` pages open at once. Returns (url, product_data) pairs in
+    input order; product_data is None for pages that failed.
+    """
+    block_stats = block_stats or BlockStats()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=headless)
+        context = await browser.new_context()
+
+        async def fetch(url):
+            async with semaphore:
+                resources = PageResources()
+                product_data = await fetch_product_data(
+                    context, url, selectors, click_selector, skip_selectors, timeouts, timer, rules, resources
+                )
+                block_stats.record(retailer, resources)
+                return url, product_data
+
+        try:
+            return await asyncio.gather(*(fetch(url) for url in urls))
+        finally:
+            await context.close()
+            await browser.close()
+
+
+def read_urls(lines):
+    """Non-empty, non-comment lines, without duplicates, in order."""
+    urls = []
+    for line in lines:
+        url = line.strip()
+        if url and not url.startswith('#') and url not in urls:
+            urls.append(url)
+    return urls
+
+
 def create_product(product_type, product_data):
     product = Creatine(
             name=product_data['name'],
             brand=product_data['brand'],
-            price=float(product_data['price'].replace('€', '').replace(',', '.')),
+            price=parse_price(product_data['price']),
             weight=int(product_data['weight']),
             url=product_data['url']
     )
@@ -70,23 +194,80 @@ def create_product(product_type, product_data):
 
 
 class Command(BaseCommand):
-    help = 'Scrape a webpage to create a model'
+    help = 'Scrape product webpages to create models'
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='*', help='Product page URLs')
+        parser.add_argument(
+            '--file',
+            help="File with one URL per line, or '-' to read them from stdin",
+        )
+        parser.add_argument(
+            '--retailer',
+            default='prozis',
+            choices=sorted(PRODUCT_SELECTORS),
+            help='Which retailer selectors to extract with (default: prozis)',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=DEFAULT_CONCURRENCY,
+            help=f'Number of pages fetched at once (default: {DEFAULT_CONCURRENCY})',
+        )
+        parser.add_argument(
+            '--headless',
+            action='store_true',
+            help='Run the browser without a window',
+        )
+        parser.add_argument(
+            '--load-all-resources',
+            action='store_true',
+            help='Do not block images, fonts, media and trackers',
+        )
 
     def handle(self, *args, **options):
-        url = args[0]
-        print(url)
-        self.handle_prozis(url)
+        lines = list(options['urls'])
+        if options['file'] == '-':
+            lines += sys.stdin.readlines()
+        elif options['file']:
+            with open(options['file']) as f:
+                lines += f.readlines()
 
-    def handle_prozis(self, url):
-        selectors = {
-            'name': 'h1.product-name',
-            'brand': 'h2.product-brand',
-            'price': 'span.price',
-            'weight': 'span.weight',
-        }
-        product_data = fetch_product_data(url, selectors, click_selector='a.btn-primary')
-        if product_data:
-            product_data['url'] = url
-            #product = create_product(product_type, product_data)
-        else:
-            logger.error("Failed to fetch product data")
+        urls = read_urls(lines)
+        if not urls:
+            raise CommandError("No URLs given.")
+
+        retailer = PRODUCT_SELECTORS[options['retailer']]
+        timer = PhaseTimer()
+        block_stats = BlockStats()
+        # Block what the updater blocks for the same retailer.
+        rules = None if options['load_all_resources'] else compile_plan(load_registry()).rules(options['retailer'])
+        results = asyncio.run(fetch_products(
+            urls,
+            retailer['selectors'],
+            click_selector=retailer.get('click_selector'),
+            skip_selectors=retailer.get('skip_selectors'),
+            timeouts=retailer.get('timeouts', DEFAULT_TIMEOUTS),
+            timer=timer.bind(options['retailer']),
+            rules=rules,
+            block_stats=block_stats,
+            retailer=options['retailer'],
+            concurrency=max(1, options['concurrency']),
+            headless=options['headless'],
+        ))
+
+        failed = 0
+        for url, product_data in results:
+            if product_data:
+                product_data['url'] = url
+                #product = create_product(product_type, product_data)
+                self.stdout.write(json.dumps(product_data, ensure_ascii=False))
+            else:
+                failed += 1
+                logger.error(f"Failed to fetch product data from {url}")
+
+        logger.info(f"Fetched {len(results) - failed} of {len(results)} products")
+        for line in timer.lines():
+            logger.info(line)
+        for line in block_stats.lines():
+            logger.info(line)
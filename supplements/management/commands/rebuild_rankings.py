@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from supplements.rankings import rebuild_ranking_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored ranking snapshots from the current prices'
+
+    def handle(self, *args, **options):
+        rebuild_ranking_snapshots()
+        self.stdout.write("Rebuilt ranking snapshots")
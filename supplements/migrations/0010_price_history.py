@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:36
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('supplements', '0009_creatine_capsule_amount_creatine_capsule_weight_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('day', models.DateField()),
+                ('min_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('max_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('close_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('content_type', 'object_id', 'day'), name='daily_price_product_day_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PriceObservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('observed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('source', models.CharField(blank=True, max_length=50)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['content_type', 'object_id', '-observed_at'], name='price_obs_product_time_idx'), models.Index(fields=['observed_at'], name='price_obs_time_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations
+from django.utils import timezone
+
+
+def seed_price_history(apps, schema_editor):
+    """Record every product's current price as the start of its history."""
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    PriceObservation = apps.get_model('supplements', 'PriceObservation')
+    DailyPrice = apps.get_model('supplements', 'DailyPrice')
+    now = timezone.now()
+    today = timezone.localdate(now)
+
+    for model_name in ('proteinpowder', 'creatine'):
+        model = apps.get_model('supplements', model_name)
+        content_type, _ = ContentType.objects.get_or_create(app_label='supplements', model=model_name)
+        products = list(model.objects.values_list('pk', 'price'))
+        PriceObservation.objects.bulk_create([
+            PriceObservation(content_type=content_type, object_id=pk, price=price, observed_at=now, source='seed')
+            for pk, price in products
+        ])
+        DailyPrice.objects.bulk_create([
+            DailyPrice(
+                content_type=content_type, object_id=pk, day=today,
+                min_price=price, max_price=price, close_price=price,
+            )
+            for pk, price in products
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('supplements', '0010_price_history'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_price_history, migrations.RunPython.noop),
+    ]
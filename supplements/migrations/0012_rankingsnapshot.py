@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supplements', '0011_seed_price_history'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RankingSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(choices=[('protein_powder', 'Proteína Whey'), ('creatine', 'Creatina')], max_length=20)),
+                ('type', models.CharField(max_length=20)),
+                ('form', models.CharField(blank=True, max_length=20)),
+                ('payload', models.JSONField()),
+                ('digest', models.CharField(max_length=64)),
+                ('updated_at', models.DateTimeField()),
+                ('built_at', models.DateTimeField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('category', 'type', 'form'), name='ranking_snapshot_slice_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supplements', '0013_catalogversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='creatine',
+            name='price_per_kg',
+            field=models.DecimalField(db_index=True, decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='creatine',
+            name='price_per_serving',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='proteinpowder',
+            name='price_per_kg',
+            field=models.DecimalField(db_index=True, decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+    ]
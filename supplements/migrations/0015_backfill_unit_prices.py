@@ -0,0 +1,43 @@
+from decimal import Decimal
+
+from django.db import migrations
+
+CENT = Decimal('0.01')
+CREATINE_SERVING_GRAMS = 3
+
+
+def per_unit(price, amount):
+    if price is None or not amount:
+        return None
+    return (Decimal(str(price)) / Decimal(str(amount))).quantize(CENT)
+
+
+def backfill_unit_prices(apps, schema_editor):
+    """Fill the stored per-unit prices of products saved before they existed."""
+    ProteinPowder = apps.get_model('supplements', 'ProteinPowder')
+    Creatine = apps.get_model('supplements', 'Creatine')
+
+    powders = list(ProteinPowder.objects.only('price', 'weight'))
+    for powder in powders:
+        powder.price_per_kg = per_unit(powder.price, powder.weight and powder.weight / 1000)
+    ProteinPowder.objects.bulk_update(powders, ['price_per_kg'], batch_size=500)
+
+    creatines = list(Creatine.objects.only('price', 'weight', 'form', 'capsule_amount', 'capsule_weight'))
+    for creatine in creatines:
+        grams = creatine.weight
+        if creatine.form == 'capsules' and creatine.capsule_amount and creatine.capsule_weight:
+            grams = creatine.capsule_amount * creatine.capsule_weight / 1000
+        creatine.price_per_kg = per_unit(creatine.price, creatine.weight and creatine.weight / 1000)
+        creatine.price_per_serving = per_unit(creatine.price, grams and grams / CREATINE_SERVING_GRAMS)
+    Creatine.objects.bulk_update(creatines, ['price_per_kg', 'price_per_serving'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supplements', '0014_stored_unit_prices'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_unit_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supplements', '0015_backfill_unit_prices'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='creatine',
+            index=models.Index(fields=['type', 'form', 'brand', 'name'], name='creatine_ranking_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='creatine',
+            index=models.Index(fields=['brand', 'type', 'form', 'weight'], name='creatine_lookup_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='proteinpowder',
+            index=models.Index(fields=['type', 'brand', 'name'], name='protein_ranking_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='proteinpowder',
+            index=models.Index(fields=['brand', 'type', 'weight'], name='protein_lookup_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('supplements', '0016_product_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RefreshState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('last_success_at', models.DateTimeField(blank=True, null=True)),
+                ('last_change_at', models.DateTimeField(blank=True, null=True)),
+                ('checks', models.PositiveIntegerField(default=0)),
+                ('failures', models.PositiveIntegerField(default=0)),
+                ('volatility', models.FloatField(default=0.5)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('content_type', 'object_id'), name='refresh_state_product_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:51
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supplements', '0017_refreshstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScrapeRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('workers', models.PositiveSmallIntegerField(default=1)),
+                ('pages', models.PositiveIntegerField(default=0)),
+                ('prices_updated', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FetchMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('retailer', models.CharField(max_length=50)),
+                ('url', models.URLField(max_length=500)),
+                ('strategy', models.CharField(choices=[('http', 'HTTP'), ('fallback', 'HTTP, then browser'), ('browser', 'Browser'), ('skipped', 'Skipped by the circuit breaker')], max_length=10)),
+                ('navigation_ms', models.PositiveIntegerField(default=0)),
+                ('wait_ms', models.PositiveIntegerField(default=0)),
+                ('work_ms', models.PositiveIntegerField(default=0)),
+                ('bytes', models.PositiveBigIntegerField(default=0)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('selectors_found', models.PositiveSmallIntegerField(default=0)),
+                ('selectors_missing', models.PositiveSmallIntegerField(default=0)),
+                ('price_changes', models.PositiveSmallIntegerField(default=0)),
+                ('price_delta', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fetches', to='supplements.scraperun')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['run', 'retailer'], name='fetch_metric_run_retailer_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supplements', '0018_scrape_telemetry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='refreshstate',
+            name='suspect_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+from importlib import import_module
+
+from django.db import migrations
+
+# Rows bulk-created or updated in bulk between 0015 and the manager that now
+# fills these columns were left with NULL per-unit prices; recompute them all.
+backfill = import_module('supplements.migrations.0015_backfill_unit_prices')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supplements', '0019_refreshstate_suspect_price'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill.backfill_unit_prices, migrations.RunPython.noop),
+    ]
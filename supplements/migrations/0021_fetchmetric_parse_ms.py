@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supplements', '0020_backfill_null_unit_prices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fetchmetric',
+            name='parse_ms',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:23
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supplements', '0021_fetchmetric_parse_ms'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='creatine',
+            name='creatine_lookup_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='proteinpowder',
+            name='protein_lookup_idx',
+        ),
+    ]
@@ -1,4 +1,130 @@
-from django.db import models
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
+from django.contrib.contenttypes.models import ContentType
+from django.db import models, transaction
+from django.utils import timezone
+
+from .money import CENT
+
+# Creatine dose that price_per_serving is based on, in grams.
+CREATINE_SERVING_GRAMS = 3
+
+
+def compute_price_per_kg(price, weight):
+    if price is None or not weight:
+        return None
+    return (Decimal(str(price)) * 1000 / weight).quantize(CENT)
+
+
+class DerivedPricesMixin:
+    """
+    Keeps the stored per-unit prices in step with price and weight whenever
+    the product is saved, and reads them and the price history back. Writes
+    that skip save() go through DerivedPricesQuerySet instead.
+    """
+    derived_price_fields = ['price_per_kg']
+    derived_from_fields = {'price', 'weight'}
+
+    def update_derived_prices(self):
+        self.price_per_kg = compute_price_per_kg(self.price, self.weight)
+
+    def save(self, *args, **kwargs):
+        self.update_derived_prices()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and self.derived_from_fields & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, *self.derived_price_fields}
+        super().save(*args, **kwargs)
+
+    def get_price_per_kg(self):
+        if self.price_per_kg is not None:
+            return float(self.price_per_kg)
+        return float("{:.2f}".format(float(self.price) / (self.weight / 1000)))
+
+    def get_price_history(self, days=30):
+        since = timezone.now() - timedelta(days=days)
+        return self.price_observations.filter(observed_at__gte=since).order_by('observed_at')
+
+
+class DerivedPricesQuerySet(models.QuerySet):
+    """
+    Fills the stored per-unit prices on the bulk write paths that bypass
+    save(), so price_per_kg is never left NULL for rankings and ordering.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.update_derived_prices()
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        derived = self.model.derived_price_fields
+        if self.model.derived_from_fields & set(fields) and not set(derived) <= set(fields):
+            objs = list(objs)
+            for obj in objs:
+                obj.update_derived_prices()
+            fields = [*fields, *derived]
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def update(self, **kwargs):
+        if not self.model.derived_from_fields & set(kwargs):
+            return super().update(**kwargs)
+        # The filter may test the fields being changed, so the rows are
+        # picked before the update and recomputed from what it wrote.
+        with transaction.atomic(using=self.db):
+            pks = list(self.values_list('pk', flat=True))
+            rows = super().update(**kwargs)
+            products = list(self.model._base_manager.using(self.db).filter(pk__in=pks))
+            for product in products:
+                product.update_derived_prices()
+            self.model._base_manager.using(self.db).bulk_update(products, self.model.derived_price_fields)
+        return rows
+
+
+class PriceObservation(models.Model):
+    """
+    A product's price from the moment it was observed. Rows are only
+    written when the price changes, so a price holds until the next row.
+    """
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveBigIntegerField()
+    product = GenericForeignKey('content_type', 'object_id')
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    observed_at = models.DateTimeField(default=timezone.now)
+    source = models.CharField(max_length=50, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['content_type', 'object_id', '-observed_at'], name='price_obs_product_time_idx'),
+            models.Index(fields=['observed_at'], name='price_obs_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.price} at {self.observed_at:%Y-%m-%d %H:%M}"
+
+
+class DailyPrice(models.Model):
+    """
+    Lowest and highest price a product had on each day, for long-range
+    charts that should not scan every observation.
+    """
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveBigIntegerField()
+    product = GenericForeignKey('content_type', 'object_id')
+    day = models.DateField()
+    min_price = models.DecimalField(max_digits=10, decimal_places=2)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2)
+    close_price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['content_type', 'object_id', 'day'], name='daily_price_product_day_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.day}: {self.min_price} - {self.max_price}"
 
 
 class Brand(models.Model):
@@ -18,7 +144,7 @@ PROTEIN_TYPE_CHOICES = [
 ]
 
 
-class ProteinPowder(models.Model):
+class ProteinPowder(DerivedPricesMixin, models.Model):
     name = models.CharField(max_length=255)
     brand = models.ForeignKey(Brand, on_delete=models.CASCADE)
     weight = models.PositiveIntegerField()
@@ -29,13 +155,21 @@ class ProteinPowder(models.Model):
     )
     image = models.ImageField(upload_to='protein_powders')
     url = models.URLField()
+    price_per_kg = models.DecimalField(max_digits=10, decimal_places=2, null=True, editable=False, db_index=True)
+    price_observations = GenericRelation(PriceObservation)
+    daily_prices = GenericRelation(DailyPrice)
+
+    objects = DerivedPricesQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Ranking pages: filter on type, then partition by brand and name.
+            models.Index(fields=['type', 'brand', 'name'], name='protein_ranking_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
-    def get_price_per_kg(self):
-        return float("{:.2f}".format(float(self.price) / (self.weight / 1000)))
-
 
 CREATINE_TYPE_CHOICES = [
     ('monohydrate', 'Monohidratada'),
@@ -48,7 +182,7 @@ CREATINE_FORM_CHOICES = [
 ]
 
 
-class Creatine(models.Model):
+class Creatine(DerivedPricesMixin, models.Model):
     name = models.CharField(max_length=255)
     brand = models.ForeignKey(Brand, on_delete=models.CASCADE)
     weight = models.PositiveIntegerField()
@@ -65,9 +199,156 @@ class Creatine(models.Model):
     capsule_weight = models.PositiveIntegerField(null=True, blank=True)
     image = models.ImageField(upload_to='protein_powders')
     url = models.URLField()
+    price_per_kg = models.DecimalField(max_digits=10, decimal_places=2, null=True, editable=False, db_index=True)
+    price_per_serving = models.DecimalField(max_digits=10, decimal_places=2, null=True, editable=False)
+    price_observations = GenericRelation(PriceObservation)
+    daily_prices = GenericRelation(DailyPrice)
+
+    objects = DerivedPricesQuerySet.as_manager()
+
+    derived_price_fields = ['price_per_kg', 'price_per_serving']
+    derived_from_fields = {'price', 'weight', 'form', 'capsule_amount', 'capsule_weight'}
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['type', 'form', 'brand', 'name'], name='creatine_ranking_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
-    def get_price_per_kg(self):
-        return float("{:.2f}".format(float(self.price) / (self.weight / 1000)))
+    def get_creatine_grams(self):
+        """Grams of creatine in the package; capsules count their fill (capsule_weight is in mg)."""
+        if self.form == 'capsules' and self.capsule_amount and self.capsule_weight:
+            return self.capsule_amount * self.capsule_weight / 1000
+        return self.weight
+
+    def update_derived_prices(self):
+        super().update_derived_prices()
+        servings = Decimal(str(self.get_creatine_grams())) / CREATINE_SERVING_GRAMS
+        if self.price is None or not servings:
+            self.price_per_serving = None
+        else:
+            self.price_per_serving = (Decimal(str(self.price)) / servings).quantize(CENT)
+
+
+RANKING_CATEGORY_CHOICES = [
+    ('protein_powder', 'Proteína Whey'),
+    ('creatine', 'Creatina'),
+]
+
+
+class RankingSnapshot(models.Model):
+    """
+    A precomputed ranking page for one (category, type, form), rebuilt after
+    every price refresh. `updated_at` is when its content last changed.
+    """
+    category = models.CharField(max_length=20, choices=RANKING_CATEGORY_CHOICES)
+    type = models.CharField(max_length=20)
+    form = models.CharField(max_length=20, blank=True)
+    payload = models.JSONField()
+    digest = models.CharField(max_length=64)
+    updated_at = models.DateTimeField()
+    built_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'type', 'form'], name='ranking_snapshot_slice_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.category} {self.type} {self.form}".strip()
+
+
+class CatalogVersion(models.Model):
+    """
+    A single row whose version goes up whenever prices or products change.
+    Cached pages are keyed on it, so a bump invalidates them all at once.
+    """
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"v{self.version}"
+
+
+class RefreshState(models.Model):
+    """
+    When a product's price was last scraped and how often it changes, so an
+    incremental refresh can fetch the products that are most likely stale.
+    `volatility` is a moving average of how many successful fetches found a
+    new price. `suspect_price` is a scraped price held back as an outlier,
+    written only if the next fetch reads it again.
+    """
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveBigIntegerField()
+    product = GenericForeignKey('content_type', 'object_id')
+    last_success_at = models.DateTimeField(null=True, blank=True)
+    last_change_at = models.DateTimeField(null=True, blank=True)
+    checks = models.PositiveIntegerField(default=0)
+    failures = models.PositiveIntegerField(default=0)
+    volatility = models.FloatField(default=0.5)
+    suspect_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['content_type', 'object_id'], name='refresh_state_product_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.content_type.model} {self.object_id}: {self.last_success_at}"
+
+
+class ScrapeRun(models.Model):
+    """One run of update_product_prices; its page fetches are FetchMetric rows."""
+    started_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    workers = models.PositiveSmallIntegerField(default=1)
+    pages = models.PositiveIntegerField(default=0)
+    prices_updated = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Run {self.pk} at {self.started_at:%Y-%m-%d %H:%M}"
+
+
+FETCH_STRATEGY_CHOICES = [
+    ('http', 'HTTP'),
+    ('fallback', 'HTTP, then browser'),
+    ('browser', 'Browser'),
+    ('skipped', 'Skipped by the circuit breaker'),
+]
+
+
+class FetchMetric(models.Model):
+    """
+    What one page load cost: milliseconds navigating, waiting for the page,
+    working on it (clicks, serialising) and parsing prices out of it, bytes
+    transferred, attempts, price selectors matched, and the total
+    absolute change of the prices read off it.
+    """
+    run = models.ForeignKey(ScrapeRun, on_delete=models.CASCADE, related_name='fetches')
+    retailer = models.CharField(max_length=50)
+    url = models.URLField(max_length=500)
+    strategy = models.CharField(max_length=10, choices=FETCH_STRATEGY_CHOICES)
+    navigation_ms = models.PositiveIntegerField(default=0)
+    wait_ms = models.PositiveIntegerField(default=0)
+    work_ms = models.PositiveIntegerField(default=0)
+    parse_ms = models.PositiveIntegerField(default=0)
+    bytes = models.PositiveBigIntegerField(default=0)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    selectors_found = models.PositiveSmallIntegerField(default=0)
+    selectors_missing = models.PositiveSmallIntegerField(default=0)
+    price_changes = models.PositiveSmallIntegerField(default=0)
+    price_delta = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['run', 'retailer'], name='fetch_metric_run_retailer_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.retailer} {self.url}"
+
+    @property
+    def total_ms(self):
+        return self.navigation_ms + self.wait_ms + self.work_ms + self.parse_ms
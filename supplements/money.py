@@ -0,0 +1,4 @@
+from decimal import Decimal
+
+# Prices and per-unit prices are stored to the cent.
+CENT = Decimal('0.01')
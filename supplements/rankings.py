@@ -0,0 +1,152 @@
+import hashlib
+import json
+from itertools import groupby
+
+from django.db import transaction
+from django.db.models import Avg, Case, F, When, Window
+from django.db.models.functions import Coalesce, FirstValue
+from django.utils import timezone
+
+from .cache import bump_catalog_version
+from .models import (
+    Creatine,
+    ProteinPowder,
+    RankingSnapshot,
+    CREATINE_FORM_CHOICES,
+    CREATINE_TYPE_CHOICES,
+    PROTEIN_TYPE_CHOICES,
+)
+
+
+def format_product(product):
+    if product.weight < 1000:
+        product.formatted_weight = f"{product.weight}g"
+    elif product.weight % 1000 == 0:
+        product.formatted_weight = f"{product.weight // 1000}kg"
+    else:
+        product.formatted_weight = f"{product.weight / 1000}kg"
+
+    product.formatted_price_per_kg = f"{product.get_price_per_kg():.2f}€/kg"
+    product.formatted_price = f"{product.price:.2f}€"
+
+
+# Products are ranked in groups of the same brand and name, most expensive
+# size first. Groups are ordered by their average price per kg over the
+# 100g-2500g sizes, or by their most expensive size's price per kg when they
+# have none in that range. Everything is computed in one query over the
+# stored price_per_kg column.
+def ranked_queryset(queryset):
+    group = [F('brand_id'), F('name')]
+    return queryset.select_related('brand').annotate(
+        rank_price_per_kg=Coalesce(
+            Window(
+                Avg(Case(When(weight__range=(100, 2500), then=F('price_per_kg')))),
+                partition_by=group,
+            ),
+            Window(FirstValue('price_per_kg'), partition_by=group, order_by=F('price').desc()),
+        ),
+    ).order_by('rank_price_per_kg', 'brand_id', 'name', '-price')
+
+
+def get_ranked_products(queryset):
+    groups = []
+    for _, products in groupby(ranked_queryset(queryset), key=lambda product: (product.brand_id, product.name)):
+        products = list(products)
+        for product in products:
+            format_product(product)
+        groups.append(products)
+    return groups
+
+
+def get_top_creatines(creatine_form, creatine_type):
+    return get_ranked_products(Creatine.objects.filter(type=creatine_type, form=creatine_form))
+
+
+def get_top_protein_powders(protein_type):
+    return get_ranked_products(ProteinPowder.objects.filter(type=protein_type))
+
+
+def ranking_slices():
+    """Every (category, type, form) a ranking page can show."""
+    for protein_type, _ in PROTEIN_TYPE_CHOICES:
+        yield 'protein_powder', protein_type, ''
+    for creatine_form, _ in CREATINE_FORM_CHOICES:
+        for creatine_type, _ in CREATINE_TYPE_CHOICES:
+            yield 'creatine', creatine_type, creatine_form
+
+
+def compute_ranking(category, product_type, form=''):
+    if category == 'creatine':
+        return get_top_creatines(form, product_type)
+    return get_top_protein_powders(product_type)
+
+
+def serialize_product(product):
+    """The fields the ranking templates read, in the same shape as a model."""
+    return {
+        'id': product.id,
+        'name': product.name,
+        'brand': {'name': product.brand.name, 'code': product.brand.code},
+        'image': {'url': product.image.url if product.image else ''},
+        'weight': product.weight,
+        'price': str(product.price),
+        'price_per_kg': product.get_price_per_kg(),
+        'formatted_weight': product.formatted_weight,
+        'formatted_price': product.formatted_price,
+        'formatted_price_per_kg': product.formatted_price_per_kg,
+    }
+
+
+def rebuild_ranking_snapshots():
+    """
+    Recompute every ranking and store it, all in one transaction so readers
+    see either the previous rankings or the new ones. A snapshot's
+    updated_at only moves when its content actually changed.
+    """
+    now = timezone.now()
+    changed = False
+    with transaction.atomic():
+        existing = {
+            (snapshot.category, snapshot.type, snapshot.form): snapshot
+            for snapshot in RankingSnapshot.objects.select_for_update()
+        }
+        for key in ranking_slices():
+            payload = [[serialize_product(product) for product in group] for group in compute_ranking(*key)]
+            digest = hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+            snapshot = existing.get(key)
+            if snapshot is None:
+                category, product_type, form = key
+                RankingSnapshot.objects.create(
+                    category=category, type=product_type, form=form,
+                    payload=payload, digest=digest, updated_at=now, built_at=now,
+                )
+                changed = True
+            elif snapshot.digest != digest:
+                snapshot.payload, snapshot.digest, snapshot.updated_at, snapshot.built_at = payload, digest, now, now
+                snapshot.save(update_fields=['payload', 'digest', 'updated_at', 'built_at'])
+                changed = True
+            else:
+                snapshot.built_at = now
+                snapshot.save(update_fields=['built_at'])
+        if changed:
+            bump_catalog_version()
+
+
+def get_ranking(category, product_type, form=''):
+    """
+    The stored ranking for a slice, in one indexed lookup. Falls back to
+    computing it live when no snapshot has been built yet.
+    """
+    payload = RankingSnapshot.objects.filter(category=category, type=product_type, form=form).values_list(
+        'payload', flat=True
+    ).first()
+    if payload is None:
+        return compute_ranking(category, product_type, form)
+    return payload
+
+
+def get_ranking_state(category, product_type, form=''):
+    """The stored (digest, updated_at) of a slice, or None before the first build."""
+    return RankingSnapshot.objects.filter(category=category, type=product_type, form=form).values_list(
+        'digest', 'updated_at'
+    ).first()
@@ -0,0 +1,145 @@
+import threading
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+DEFAULT_BLOCKED_TYPES = frozenset({'image', 'media', 'font'})
+# Analytics, ads and session-recording hosts seen on the shops we scrape.
+# Matched as host suffixes by Playwright, and as exact hosts by Firefox.
+TRACKER_DOMAINS = frozenset({
+    'www.google-analytics.com',
+    'www.googletagmanager.com',
+    'googleads.g.doubleclick.net',
+    'stats.g.doubleclick.net',
+    'connect.facebook.net',
+    'static.hotjar.com',
+    'script.hotjar.com',
+    'www.clarity.ms',
+    'bat.bing.com',
+    'analytics.tiktok.com',
+    'static.criteo.net',
+    'widget.trustpilot.com',
+})
+# Rough transfer sizes, used to estimate what a blocked request would have cost.
+TYPICAL_BYTES = {
+    'image': 40_000,
+    'media': 500_000,
+    'font': 30_000,
+    'script': 60_000,
+    'stylesheet': 30_000,
+}
+DEFAULT_TYPICAL_BYTES = 5_000
+
+
+def domain_matches(host, domains):
+    return any(host == domain or host.endswith('.' + domain) for domain in domains)
+
+
+class ResourceRules:
+    """
+    Which requests a scraper page may skip: anything of a blocked resource
+    type, and anything to a denied host, unless the host is allowed. Equal
+    rules compare and hash alike, so browsers can be shared by rule set.
+    """
+
+    def __init__(self, block_types=DEFAULT_BLOCKED_TYPES, deny_domains=TRACKER_DOMAINS, allow_domains=()):
+        self.block_types = frozenset(block_types)
+        self.deny_domains = frozenset(deny_domains)
+        self.allow_domains = frozenset(allow_domains)
+
+    def __eq__(self, other):
+        if not isinstance(other, ResourceRules):
+            return NotImplemented
+        return self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def key(self):
+        return self.block_types, self.deny_domains, self.allow_domains
+
+    def extend(self, block_types=(), deny_domains=(), allow_domains=()):
+        return ResourceRules(
+            self.block_types | set(block_types),
+            self.deny_domains | set(deny_domains),
+            self.allow_domains | set(allow_domains),
+        )
+
+    def should_block(self, url, resource_type):
+        host = urlsplit(url).hostname or ''
+        if domain_matches(host, self.allow_domains):
+            return False
+        if resource_type in self.block_types:
+            return True
+        return domain_matches(host, self.deny_domains)
+
+    def firefox_preferences(self):
+        """
+        Firefox cannot intercept requests per page without BiDi, so the same
+        rules are applied to the whole browser profile instead: blocked types
+        through content preferences, denied hosts by resolving them to
+        localhost, and Firefox's own tracking protection on top.
+        """
+        preferences = {'privacy.trackingprotection.enabled': True}
+        if 'image' in self.block_types:
+            preferences['permissions.default.image'] = 2
+        if 'font' in self.block_types:
+            preferences['gfx.downloadable_fonts.enabled'] = False
+        if 'media' in self.block_types:
+            preferences['media.autoplay.default'] = 5
+            preferences['media.preload.default'] = 0
+            preferences['media.preload.auto'] = 0
+        denied = sorted(self.deny_domains - self.allow_domains)
+        if denied:
+            preferences['network.dns.localDomains'] = ','.join(denied)
+        return preferences
+
+
+DEFAULT_RULES = ResourceRules()
+
+
+class PageResources:
+    def __init__(self):
+        self.blocked = 0
+        self.saved_bytes = 0
+        self.loaded = 0
+        self.loaded_bytes = 0
+
+    def block(self, resource_type):
+        self.blocked += 1
+        self.saved_bytes += TYPICAL_BYTES.get(resource_type, DEFAULT_TYPICAL_BYTES)
+
+    def load(self, size):
+        self.loaded += 1
+        self.loaded_bytes += size or 0
+
+
+class BlockStats:
+    """Per-retailer totals of requests blocked and loaded by scraper pages."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pages = defaultdict(int)
+        self.totals = defaultdict(PageResources)
+
+    def record(self, retailer, resources):
+        with self._lock:
+            self.pages[retailer] += 1
+            totals = self.totals[retailer]
+            totals.blocked += resources.blocked
+            totals.saved_bytes += resources.saved_bytes
+            totals.loaded += resources.loaded
+            totals.loaded_bytes += resources.loaded_bytes
+
+    def lines(self):
+        blocked = sum(totals.blocked for totals in self.totals.values())
+        saved = sum(totals.saved_bytes for totals in self.totals.values())
+        # Firefox only shows the images it left unloaded, and sizes are
+        # typical ones: the count is a lower bound and the bytes an estimate.
+        yield f"Blocked at least {blocked} requests, saving an estimated {saved / 1_000_000:.1f} MB"
+        for retailer in sorted(self.pages):
+            pages = self.pages[retailer]
+            totals = self.totals[retailer]
+            yield (
+                f"  {retailer}: per page {totals.blocked / pages:.0f} blocked (~{totals.saved_bytes / pages / 1000:.0f} kB), "
+                f"{totals.loaded / pages:.0f} loaded ({totals.loaded_bytes / pages / 1000:.0f} kB)"
+            )
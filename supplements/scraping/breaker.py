@@ -0,0 +1,133 @@
+import logging
+import random
+import threading
+import time
+from collections import defaultdict, deque
+
+logger = logging.getLogger(__name__)
+
+# A retailer's circuit opens once at least MIN_CALLS of its last WINDOW page
+# fetches were made and FAILURE_RATE of them failed.
+WINDOW = 10
+MIN_CALLS = 4
+FAILURE_RATE = 0.5
+# How long an open circuit stays open, in seconds; doubled each time a probe
+# fails, up to MAX_COOLDOWN.
+BASE_COOLDOWN = 30
+MAX_COOLDOWN = 600
+# Retry delays for a single page, in seconds, before jitter.
+BASE_RETRY_DELAY = 1
+MAX_RETRY_DELAY = 20
+
+
+def backoff_delay(attempt, base=BASE_RETRY_DELAY, cap=MAX_RETRY_DELAY, rng=random):
+    """Exponential backoff with full jitter: anywhere up to base * 2**attempt, capped."""
+    return rng.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Tracks one retailer's recent page fetches. While closed, every fetch is
+    allowed. When too many fail the circuit opens and fetches are refused
+    for a jittered cooldown; after it a single probe is let through
+    (half-open) and its outcome closes the circuit or reopens it for longer.
+
+    allow() returns the permit to hand back to record(), or None. Outcomes
+    arriving while the circuit is open, or half-open from anything but the
+    probe, come from fetches started before the trip and are ignored.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, window=WINDOW, min_calls=MIN_CALLS, failure_rate=FAILURE_RATE,
+                 base_cooldown=BASE_COOLDOWN, max_cooldown=MAX_COOLDOWN, clock=time.monotonic, rng=random):
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self.clock = clock
+        self.rng = rng
+        self.outcomes = deque(maxlen=window)
+        self.state = self.CLOSED
+        self.trips = 0
+        self.open_until = 0.0
+        self.probe = None
+
+    def allow(self):
+        if self.state == self.CLOSED:
+            return self.CLOSED
+        if self.state == self.OPEN and self.clock() >= self.open_until:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN and self.probe is None:
+            self.probe = object()
+            return self.probe
+        return None
+
+    def record(self, success, permit=None):
+        if self.state == self.OPEN:
+            return
+        if self.state == self.HALF_OPEN:
+            if permit is None or permit is not self.probe:
+                return
+            self.probe = None
+            if success:
+                self.state = self.CLOSED
+                self.trips = 0
+                self.outcomes.clear()
+            else:
+                self.trip()
+            return
+
+        self.outcomes.append(success)
+        failures = self.outcomes.count(False)
+        if len(self.outcomes) >= self.min_calls and failures / len(self.outcomes) >= self.failure_rate:
+            self.trip()
+
+    def trip(self):
+        cooldown = min(self.max_cooldown, self.base_cooldown * 2 ** self.trips)
+        self.open_until = self.clock() + self.rng.uniform(cooldown / 2, cooldown)
+        self.state = self.OPEN
+        self.trips += 1
+        self.outcomes.clear()
+
+
+class RetailerBreakers:
+    """A CircuitBreaker per retailer, shared by the pool workers."""
+
+    def __init__(self, **options):
+        self._lock = threading.Lock()
+        self.options = options
+        self.breakers = {}
+        self.refused = defaultdict(int)
+        self.opened = defaultdict(int)
+
+    def breaker(self, retailer):
+        if retailer not in self.breakers:
+            self.breakers[retailer] = CircuitBreaker(**self.options)
+        return self.breakers[retailer]
+
+    def allow(self, retailer):
+        with self._lock:
+            permit = self.breaker(retailer).allow()
+            if permit is None:
+                self.refused[retailer] += 1
+            return permit
+
+    def record(self, retailer, success, permit=None):
+        with self._lock:
+            breaker = self.breaker(retailer)
+            was_open = breaker.state == CircuitBreaker.OPEN
+            breaker.record(success, permit)
+            if breaker.state == CircuitBreaker.OPEN and not was_open:
+                self.opened[retailer] += 1
+                logger.warning(f"{retailer} keeps failing, pausing its fetches for a while.")
+
+    def lines(self):
+        if not self.opened:
+            return
+        yield f"Circuit opened for {len(self.opened)} retailers"
+        for retailer in sorted(self.opened):
+            yield (
+                f"  {retailer}: opened {self.opened[retailer]} times, {self.refused[retailer]} pages skipped, "
+                f"now {self.breakers[retailer].state}"
+            )
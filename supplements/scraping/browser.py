@@ -0,0 +1,235 @@
+import logging
+import os
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from selenium import webdriver
+from selenium.webdriver.firefox.service import Service
+from selenium.webdriver.firefox.options import Options
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import (
+    ElementClickInterceptedException,
+    StaleElementReferenceException,
+    TimeoutException,
+)
+
+from .blocking import DEFAULT_RULES, PageResources
+from .parsing import SELENIUM_EXTRACT_SCRIPT
+from .waits import DEFAULT_TIMEOUTS, PhaseTimer
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def geckodriver_path():
+    """
+    Path to the geckodriver binary. GECKODRIVER_PATH wins when set; otherwise
+    webdriver-manager resolves it once per process from its on-disk cache and
+    only downloads when that cache is empty or stale.
+    """
+    path = os.environ.get('GECKODRIVER_PATH')
+    if path:
+        return path
+
+    from webdriver_manager.firefox import GeckoDriverManager
+    return GeckoDriverManager().install()
+
+
+class BrowserSessionFactory:
+    """
+    Starts Firefox sessions on demand and keeps track of them. Released
+    sessions are handed out again instead of launching a new browser, and
+    close() (or leaving the `with` block) quits every session it started.
+    Blocking is set in a Firefox profile when it starts, so sessions are
+    kept per ResourceRules and only handed out for the rules they were
+    started with. `rules` is used when acquire() is given none; pass None
+    to load everything in every session.
+    """
+
+    def __init__(self, headless=False, rules=DEFAULT_RULES):
+        self.headless = headless
+        self.rules = rules
+        self._idle = defaultdict(list)
+        self._live = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def session_rules(self, rules=None):
+        if self.rules is None:
+            return None
+        return rules or self.rules
+
+    def options(self, rules):
+        options = Options()
+        if self.headless:
+            options.add_argument("--headless")
+        if rules:
+            for name, value in rules.firefox_preferences().items():
+                options.set_preference(name, value)
+        return options
+
+    def create(self, rules):
+        service = Service(geckodriver_path())
+        return webdriver.Firefox(service=service, options=self.options(rules))
+
+    def acquire(self, rules=None):
+        rules = self.session_rules(rules)
+        with self._lock:
+            if self._idle[rules]:
+                return self._idle[rules].pop()
+        driver = self.create(rules)
+        with self._lock:
+            self._live[driver] = rules
+        return driver
+
+    def release(self, driver):
+        with self._lock:
+            if driver in self._live:
+                self._idle[self._live[driver]].append(driver)
+
+    def close(self):
+        with self._lock:
+            drivers, self._live, self._idle = list(self._live), {}, defaultdict(list)
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception as e:
+                logger.warning(f"Could not close browser session: {e}")
+
+
+PAGE_RESOURCES_SCRIPT = """
+const entries = performance.getEntriesByType('resource').concat(performance.getEntriesByType('navigation'));
+return {
+    loaded: entries.length,
+    bytes: entries.reduce((sum, entry) => sum + (entry.transferSize || 0), 0),
+    blocked_images: Array.from(document.images).filter(img => img.currentSrc && img.naturalWidth === 0).length,
+};
+"""
+
+
+def page_resources(driver):
+    """
+    What the current page loaded, from the Performance API. Firefox does not
+    report requests it refused, so images left unloaded by the image
+    preference stand in for the blocked count.
+    """
+    resources = PageResources()
+    try:
+        counts = driver.execute_script(PAGE_RESOURCES_SCRIPT)
+    except Exception as e:
+        logger.info(f"Could not read page resources: {e}")
+        return resources
+    resources.loaded = counts['loaded']
+    resources.loaded_bytes = counts['bytes']
+    for _ in range(counts['blocked_images']):
+        resources.block('image')
+    return resources
+
+
+def first_text(driver, selectors):
+    for selector in selectors:
+        try:
+            elements = driver.find_elements(By.CSS_SELECTOR, selector)
+            if elements:
+                return elements[0].text
+        except StaleElementReferenceException:
+            return None
+    return None
+
+
+def wait_for_selectors(driver, selectors, timeout):
+    """
+    Wait until the document has loaded and every selector is in the DOM.
+    Gives up quietly after `timeout` seconds; missing selectors are reported
+    by whoever reads the page.
+    """
+    def ready(driver):
+        if driver.execute_script("return document.readyState") != "complete":
+            return False
+        return all(driver.find_elements(By.CSS_SELECTOR, selector) for selector in selectors or ())
+
+    try:
+        WebDriverWait(driver, timeout).until(ready)
+        return True
+    except TimeoutException:
+        logger.info(f"Page not ready after {timeout}s, reading it as it is.")
+        return False
+
+
+def selenium_open(driver, url, click_selector=None, skip_selectors=None, ready_selectors=None,
+                  timeouts=DEFAULT_TIMEOUTS, timer=None):
+    """
+    Load `url`, dismiss `skip_selectors`, click `click_selector` and return
+    once `ready_selectors` are present. Every wait is bounded by the
+    retailer's TimeoutProfile and ends as soon as the page is ready.
+    """
+    timer = timer or PhaseTimer().bind(url)
+    ready_selectors = ready_selectors or []
+    driver.implicitly_wait(0)
+    driver.set_page_load_timeout(timeouts.page_load)
+
+    with timer.measure('navigation'):
+        driver.get(url)
+
+    if skip_selectors:
+        for skip_selector in skip_selectors:
+            try:
+                with timer.measure('wait'):
+                    element = WebDriverWait(driver, timeouts.optional).until(
+                        EC.element_to_be_clickable((By.CSS_SELECTOR, skip_selector))
+                    )
+                with timer.measure('work'):
+                    driver.execute_script("arguments[0].click();", element)
+            except TimeoutException:
+                logger.info(f"Skip element with selector {skip_selector} did not show up.")
+            except Exception as e:
+                logger.warning(f"Could not click skip element with selector {skip_selector}: {e}")
+
+    if click_selector:
+        with timer.measure('wait'):
+            wait_for_selectors(driver, ready_selectors, timeouts.element)
+        before = first_text(driver, ready_selectors)
+
+        try:
+            with timer.measure('wait'):
+                element = WebDriverWait(driver, timeouts.element).until(
+                    EC.element_to_be_clickable((By.CSS_SELECTOR, click_selector))
+                )
+            with timer.measure('work'):
+                driver.execute_script("arguments[0].click();", element)
+        except ElementClickInterceptedException:
+            logger.warning(f"Element with selector {click_selector} was intercepted. Trying to click using JavaScript.")
+            element = driver.find_element(By.CSS_SELECTOR, click_selector)
+            driver.execute_script("arguments[0].click();", element)
+        except Exception as e:
+            logger.warning(f"Could not click element with selector {click_selector}: {e}")
+
+        if before is not None:
+            with timer.measure('wait'):
+                try:
+                    WebDriverWait(driver, timeouts.settle, ignored_exceptions=(StaleElementReferenceException,)).until(
+                        lambda driver: first_text(driver, ready_selectors) != before
+                    )
+                except TimeoutException:
+                    pass
+
+    with timer.measure('wait'):
+        wait_for_selectors(driver, ready_selectors, timeouts.element)
+
+
+def selenium_extract(driver, selectors):
+    """
+    {key: text} of the first match of every {key: selector}, or None where
+    nothing matched, read inside the page in one script call instead of
+    sending the whole DOM back to be parsed.
+    """
+    return driver.execute_script(SELENIUM_EXTRACT_SCRIPT, dict(selectors))
+
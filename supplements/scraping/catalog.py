@@ -0,0 +1,80 @@
+from collections import defaultdict
+
+from supplements.models import Creatine, ProteinPowder
+
+CATEGORY_MODELS = {
+    'protein_powder': ProteinPowder,
+    'creatine': Creatine,
+}
+# Protein powders have no form field; they are all powders.
+DEFAULT_FORM = 'powder'
+
+
+class ProductSpec:
+    """How a retailer's listing identifies one of our products."""
+
+    def __init__(self, category, weight, variant, brand_code, form=None, name=None):
+        self.category = category
+        self.weight = weight
+        self.variant = variant
+        self.brand_code = brand_code
+        self.form = form or DEFAULT_FORM
+        self.name = name or None
+
+    def key(self):
+        return (self.category, self.variant, self.form, self.weight, self.brand_code)
+
+    def __str__(self):
+        name = f" {self.name}" if self.name else ""
+        return f"{self.brand_code}{name} {self.category} {self.variant} {self.form} {self.weight}g"
+
+
+class ProductIndex:
+    """
+    The products a fetch plan can refer to, loaded with one query per model
+    and indexed by (category, variant, form, weight, brand code). Specs
+    resolve against the index instead of a query each; the ones that match
+    no product, or several, are collected in `missing`. Listed brands are
+    loaded whole, for retailers that sell every product of a brand.
+    """
+
+    def __init__(self, products=()):
+        self.products = defaultdict(list)
+        self.by_brand = defaultdict(list)
+        self.missing = []
+        for category, product in products:
+            self.add(category, product)
+
+    @classmethod
+    def load(cls, specs, listings=()):
+        brand_codes = defaultdict(set)
+        for spec in specs:
+            brand_codes[spec.category].add(spec.brand_code)
+        for category, brand_code in listings:
+            brand_codes[category].add(brand_code)
+
+        index = cls()
+        for category, codes in brand_codes.items():
+            products = CATEGORY_MODELS[category].objects.filter(brand__code__in=codes).select_related('brand')
+            for product in products.order_by('pk'):
+                index.add(category, product)
+        return index
+
+    def add(self, category, product):
+        form = getattr(product, 'form', DEFAULT_FORM)
+        key = (category, product.type, form, product.weight, product.brand.code)
+        self.products[key].append(product)
+        self.by_brand[category, product.brand.code].append(product)
+
+    def resolve(self, spec):
+        candidates = self.products.get(spec.key(), [])
+        if spec.name:
+            candidates = [product for product in candidates if product.name == spec.name]
+        if len(candidates) == 1:
+            return candidates[0]
+        reason = 'not found' if not candidates else f'{len(candidates)} matches'
+        self.missing.append((spec, reason))
+        return None
+
+    def listed(self, category, brand_code):
+        return self.by_brand.get((category, brand_code), [])
@@ -0,0 +1,66 @@
+import threading
+from collections import defaultdict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .waits import PhaseTimer
+
+HTTP_TIMEOUT = 15  # seconds
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64; rv:131.0) Gecko/20100101 Firefox/131.0',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'pt-PT,pt;q=0.9,en;q=0.5',
+}
+
+
+def new_http_session(pool_maxsize=4):
+    """A keep-alive session that reuses connections to each shop across page loads."""
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=pool_maxsize)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def http_get(session, url, timeout=HTTP_TIMEOUT, timer=None):
+    timer = timer or PhaseTimer().bind(url)
+    with timer.measure('navigation'):
+        response = session.get(url, timeout=timeout)
+        response.raise_for_status()
+    return response
+
+
+class FetchStats:
+    """
+    Counts how each page was served: straight over HTTP, over HTTP and then
+    again in the browser because something was missing, or browser only.
+    """
+
+    OUTCOMES = ('http', 'fallback', 'browser')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = defaultdict(lambda: dict.fromkeys(self.OUTCOMES, 0))
+
+    def record(self, retailer, outcome):
+        with self._lock:
+            self.counts[retailer][outcome] += 1
+
+    def total(self, outcome):
+        return sum(counts[outcome] for counts in self.counts.values())
+
+    def lines(self):
+        attempts = self.total('http') + self.total('fallback')
+        hit_rate = self.total('http') / attempts * 100 if attempts else 0.0
+        yield (
+            f"Plain HTTP served {self.total('http')} of {attempts} attempted pages ({hit_rate:.0f}% hit rate), "
+            f"{self.total('browser') + self.total('fallback')} pages needed the browser"
+        )
+        for retailer in sorted(self.counts):
+            counts = self.counts[retailer]
+            yield (
+                f"  {retailer}: {counts['http']} http, {counts['fallback']} fallback, "
+                f"{counts['browser']} browser"
+            )
@@ -0,0 +1,132 @@
+import importlib.util
+import logging
+import re
+
+from bs4 import BeautifulSoup
+from django.core.exceptions import ImproperlyConfigured
+
+from .prices import DEFAULT_LOCALE, PriceFormatError, parse_prices
+
+logger = logging.getLogger(__name__)
+
+# Parser backends, fastest first, with the module each one needs. 'auto'
+# picks the first one installed: selectolax (Lexbor, C) and lxml (libxml2,
+# C) are optional; html.parser is pure Python and always there.
+BACKENDS = {
+    'selectolax': 'selectolax',
+    'lxml': 'lxml',
+    'html.parser': 'bs4',
+}
+# Markup no price selector ever reads. Scripts, inline JSON state, styles
+# and SVG icons are most of a shop page's weight, so the parser is only
+# given what is left.
+# The tag name must end where the pattern does, or custom elements such as
+# <svg-icon> would start a match running to the next </svg>.
+UNUSED_MARKUP = re.compile(r'<(script|style|svg|noscript|template)(?=[\s/>]).*?</\1\s*>|<!--.*?-->', re.S | re.I)
+# The same read done inside the browser: the text of the first match of
+# every {key: selector}, or null. textContent is what the parsers above read
+# too, hidden text included. An invalid selector reads as no match.
+EXTRACT_FUNCTION = """
+selectors => {
+    const texts = {};
+    for (const [key, selector] of Object.entries(selectors)) {
+        let element = null;
+        try {
+            element = document.querySelector(selector);
+        } catch (e) {}
+        texts[key] = element ? element.textContent : null;
+    }
+    return texts;
+}
+"""
+SELENIUM_EXTRACT_SCRIPT = f"return ({EXTRACT_FUNCTION})(arguments[0]);"
+
+
+def available_backends():
+    return [name for name, module in BACKENDS.items() if importlib.util.find_spec(module)]
+
+
+class SoupPage:
+    def __init__(self, html, features):
+        self.soup = BeautifulSoup(html, features)
+
+    def text(self, selector):
+        element = self.soup.select_one(selector)
+        return None if element is None else element.get_text()
+
+
+class LexborPage:
+    def __init__(self, html):
+        from selectolax.lexbor import LexborHTMLParser
+        self.tree = LexborHTMLParser(html)
+
+    def text(self, selector):
+        node = self.tree.css_first(selector)
+        return None if node is None else node.text()
+
+
+class HtmlParser:
+    """
+    Turns page HTML into something price selectors can be run against,
+    with the given backend. With `subtree`, markup no selector reads is
+    dropped before parsing.
+    """
+
+    def __init__(self, backend='auto', subtree=True):
+        available = available_backends()
+        if backend == 'auto':
+            backend = available[0]
+        if backend not in BACKENDS:
+            raise ImproperlyConfigured(f"Unknown HTML parser {backend}; use one of {', '.join(BACKENDS)}")
+        if backend not in available:
+            raise ImproperlyConfigured(f"HTML parser {backend} needs the {BACKENDS[backend]} package installed")
+        self.backend = backend
+        self.subtree = subtree
+
+    def parse(self, html):
+        if self.subtree:
+            html = UNUSED_MARKUP.sub('', html)
+        if self.backend == 'selectolax':
+            return LexborPage(html)
+        return SoupPage(html, self.backend)
+
+    def __str__(self):
+        return f"{self.backend} (subtree)" if self.subtree else self.backend
+
+
+DEFAULT_PARSER = HtmlParser()
+
+
+def read_prices(html, job, parser=DEFAULT_PARSER, locale=DEFAULT_LOCALE, warn=True, record=None):
+    """
+    One Decimal price (or None) per job target, read off the page's HTML.
+    `record` gets how many of the price selectors matched.
+    """
+    page = parser.parse(html)
+    texts = {target.price_selector: page.text(target.price_selector) for target in job.targets}
+    return prices_from_texts(texts, job, locale, warn, record)
+
+
+def prices_from_texts(texts, job, locale=DEFAULT_LOCALE, warn=True, record=None):
+    """
+    One Decimal price (or None) per job target from the {price selector:
+    text} read off its page, by a parser or in the browser.
+    """
+    prices = [None] * len(job.targets)
+    found = 0
+
+    parsed = parse_prices([texts.get(target.price_selector) for target in job.targets], locale)
+    for i, (target, price) in enumerate(zip(job.targets, parsed)):
+        if price is None:
+            if warn:
+                logger.warning(f"Price element {target.price_selector} not found on {job.url}.")
+            continue
+        found += 1
+        if isinstance(price, PriceFormatError):
+            logger.error(f"Could not parse price from {target.price_selector} on {job.url}: {price}")
+            continue
+        prices[i] = price
+
+    if record:
+        record.selectors_found, record.selectors_missing = found, len(job.targets) - found
+    return prices
@@ -0,0 +1,207 @@
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETAILER_LIMIT = 2
+
+
+class PriceTarget:
+    def __init__(self, retailer, product, price_selector):
+        self.retailer = retailer
+        self.product = product
+        self.price_selector = price_selector
+
+
+class ScrapeJob:
+    """
+    One page load: a URL in a given click state, and every product whose
+    price can be read off that rendered page.
+    """
+
+    def __init__(self, retailer, url, click_selector=None, skip_selectors=None):
+        self.retailer = retailer
+        self.url = url
+        self.click_selector = click_selector
+        self.skip_selectors = skip_selectors
+        self.targets = []
+
+    @staticmethod
+    def page_key(retailer, url, click_selector=None, skip_selectors=None):
+        return (retailer, url, click_selector, tuple(skip_selectors or ()))
+
+    def add_target(self, product, price_selector):
+        for target in self.targets:
+            if target.product == product and target.price_selector == price_selector:
+                return target
+        target = PriceTarget(self.retailer, product, price_selector)
+        self.targets.append(target)
+        return target
+
+
+class PoolSummary:
+    def __init__(self, workers):
+        self.workers = workers
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self.pages = defaultdict(int)
+        self.succeeded = defaultdict(int)
+        self.failed = defaultdict(int)
+        self.busy_seconds = defaultdict(float)
+
+    def record(self, job, prices, seconds):
+        found = sum(1 for price in prices if price is not None)
+        self.pages[job.retailer] += 1
+        self.succeeded[job.retailer] += found
+        self.failed[job.retailer] += len(job.targets) - found
+        self.busy_seconds[job.retailer] += seconds
+
+    @property
+    def elapsed(self):
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+    @property
+    def total(self):
+        return sum(self.succeeded.values()) + sum(self.failed.values())
+
+    @property
+    def total_pages(self):
+        return sum(self.pages.values())
+
+    @property
+    def throughput(self):
+        """Products fetched per minute of wall-clock time."""
+        if not self.elapsed:
+            return 0.0
+        return self.total / self.elapsed * 60
+
+    def lines(self):
+        yield (
+            f"Fetched {self.total} products from {self.total_pages} pages with {self.workers} workers "
+            f"in {self.elapsed:.1f}s ({self.throughput:.1f} products/min)"
+        )
+        for retailer in sorted(self.pages):
+            average = self.busy_seconds[retailer] / self.pages[retailer]
+            yield (
+                f"  {retailer}: {self.succeeded[retailer]} ok, {self.failed[retailer]} failed, "
+                f"{self.pages[retailer]} pages, {average:.1f}s/page"
+            )
+
+
+class BrowserPool:
+    """
+    Runs scrape jobs on `workers` threads, each owning one browser session
+    created by `session_factory`. Jobs are handed out round-robin across
+    retailers, and no retailer ever has more than its limit in flight.
+    """
+
+    def __init__(self, session_factory, workers=1, retailer_limits=None, default_limit=DEFAULT_RETAILER_LIMIT):
+        self.session_factory = session_factory
+        self.workers = max(1, workers)
+        self.retailer_limits = retailer_limits or {}
+        self.default_limit = default_limit
+        self._jobs = {}
+        self._pending = defaultdict(deque)
+        self._in_flight = defaultdict(int)
+        self._order = deque()
+        self._condition = threading.Condition()
+
+    def submit(self, retailer, product, url=None, click_selector=None, skip_selectors=None, price_selector=None):
+        """
+        Queue `product` for a price read. Products that share a page (same
+        URL, click state and skip selectors) are folded into one job so the
+        page is only loaded once.
+        """
+        url = url or product.url
+        key = ScrapeJob.page_key(retailer, url, click_selector, skip_selectors)
+        job = self._jobs.get(key)
+        if job is None:
+            job = ScrapeJob(retailer, url, click_selector, skip_selectors)
+            self._jobs[key] = job
+            if retailer not in self._pending:
+                self._order.append(retailer)
+            self._pending[retailer].append(job)
+        job.add_target(product, price_selector)
+        return job
+
+    def limit_for(self, retailer):
+        return max(1, self.retailer_limits.get(retailer, self.default_limit))
+
+    def run(self, fetch):
+        """
+        Call `fetch(session, job)` for every queued page and yield
+        `(target, price)` pairs in the calling thread as they complete, so
+        the caller can touch the database without sharing connections across
+        threads. `fetch` returns one price per job target; a page whose fetch
+        raises yields None for all of its targets.
+        """
+        self.summary = PoolSummary(self.workers)
+        results = queue.Queue()
+        threads = [
+            threading.Thread(target=self._worker, args=(fetch, results), name=f"scraper-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        running = len(threads)
+        while running:
+            item = results.get()
+            if item is None:
+                running -= 1
+                continue
+            job, prices, seconds = item
+            self.summary.record(job, prices, seconds)
+            yield from zip(job.targets, prices)
+
+        for thread in threads:
+            thread.join()
+        self.summary.finished_at = time.monotonic()
+
+    def _next_job(self):
+        with self._condition:
+            while True:
+                if not any(self._pending.values()):
+                    return None
+                for _ in range(len(self._order)):
+                    retailer = self._order[0]
+                    self._order.rotate(-1)
+                    if self._pending[retailer] and self._in_flight[retailer] < self.limit_for(retailer):
+                        self._in_flight[retailer] += 1
+                        return self._pending[retailer].popleft()
+                self._condition.wait()
+
+    def _release(self, retailer):
+        with self._condition:
+            self._in_flight[retailer] -= 1
+            self._condition.notify_all()
+
+    def _worker(self, fetch, results):
+        session = None
+        try:
+            while True:
+                job = self._next_job()
+                if job is None:
+                    return
+                started = time.monotonic()
+                prices = [None] * len(job.targets)
+                try:
+                    if session is None:
+                        session = self.session_factory()
+                    prices = fetch(session, job)
+                except Exception as e:
+                    logger.error(f"Worker {threading.current_thread().name} failed on {job.url}: {e}")
+                finally:
+                    self._release(job.retailer)
+                results.put((job, prices, time.monotonic() - started))
+        finally:
+            if session is not None:
+                try:
+                    session.quit()
+                except Exception as e:
+                    logger.warning(f"Could not close browser session: {e}")
+            results.put(None)
@@ -0,0 +1,151 @@
+import logging
+import re
+from decimal import Decimal, InvalidOperation
+
+from supplements.money import CENT
+
+logger = logging.getLogger(__name__)
+
+# Decimal and thousands separators, by the locale a retailer's pages are
+# written in. A price that does not read in its retailer's locale is tried
+# in the other convention, for shops that mix them.
+LOCALES = {
+    'pt': (',', '.'),
+    'es': (',', '.'),
+    'en': ('.', ','),
+}
+DEFAULT_LOCALE = 'pt'
+# A scraped price below MAX_DROP or above MAX_RISE times the last known one
+# is held back as a likely bad scrape (another variant, a per-unit or bundle
+# price) until a later run reads the same price again.
+MAX_DROP = Decimal('0.5')
+MAX_RISE = Decimal('2')
+
+SPACES = re.compile(r'\s+')
+PERCENT = re.compile(r'[-+]?\d+(?:[.,]\d+)?\s*%')
+AMOUNT = r'\d+(?:[., ]\d+)*'
+AMOUNTS = re.compile(AMOUNT)
+# An amount followed by this is a per-unit price ("14,95 €/kg").
+PER_UNIT = re.compile(r'\s*(?:€|eur)?\s*/')
+RANGE = re.compile(
+    rf'\b(?:desde|a partir de|from)\b|{AMOUNT}\s*(?:€|eur)?\s*(?:-|–|—|\ba\b|\bto\b|\baté\b|\bhasta\b)\s*(?:€\s*)?\d'
+)
+# "de 39,90 € por 29,90 €": the price is the first one after the last of these.
+PROMO = re.compile(r'\b(?:por|agora|ahora|now)\b')
+
+
+def amount_pattern(decimal, group):
+    decimal, group = re.escape(decimal), re.escape(group)
+    return re.compile(rf'(?:\d{{1,3}}(?:{group}\d{{3}})+|\d+)(?:{decimal}(\d{{1,2}}))?')
+
+
+PATTERNS = {separators: amount_pattern(*separators) for separators in set(LOCALES.values())}
+
+
+class PriceFormatError(ValueError):
+    pass
+
+
+def to_decimal(amount, decimal, group):
+    match = PATTERNS[decimal, group].fullmatch(amount)
+    if not match:
+        return None
+    whole = amount[:match.start(1) - 1] if match.group(1) else amount
+    cents = match.group(1) or '0'
+    try:
+        return Decimal(f"{whole.replace(group, '')}.{cents}").quantize(CENT)
+    except InvalidOperation:
+        return None
+
+
+def parse_price(text, locale=DEFAULT_LOCALE):
+    """
+    The price in a scraped text as a Decimal, reading it in `locale` first.
+    Currency signs, spaces, per-unit prices and discount percentages are
+    ignored; in a promotion the new price is taken. Ranges, several prices
+    with no promotion, or none at all raise PriceFormatError.
+    """
+    decimal, group = LOCALES[locale]
+    text = PERCENT.sub(' ', SPACES.sub(' ', text).strip().lower())
+    if RANGE.search(text):
+        raise PriceFormatError(f"price range in {text!r}")
+
+    promo = None
+    for promo in PROMO.finditer(text):
+        pass
+    amounts = [
+        match.group() for match in AMOUNTS.finditer(text, promo.end() if promo else 0)
+        if not PER_UNIT.match(text, match.end())
+    ]
+    if not amounts:
+        raise PriceFormatError(f"no price in {text!r}")
+    if len(amounts) > 1 and not promo:
+        raise PriceFormatError(f"several prices in {text!r}")
+
+    amount = amounts[0].replace(' ', '')
+    price = to_decimal(amount, decimal, group)
+    if price is None:
+        price = to_decimal(amount, group, decimal)
+    if price is None:
+        raise PriceFormatError(f"unreadable price {amount!r}")
+    if price <= 0:
+        raise PriceFormatError(f"price {price} is not positive")
+    return price
+
+
+def parse_prices(texts, locale=DEFAULT_LOCALE):
+    """
+    parse_price() over a batch of texts: per text its price, None for a
+    missing text, or the PriceFormatError it raised.
+    """
+    results = []
+    for text in texts:
+        if text is None:
+            results.append(None)
+            continue
+        try:
+            results.append(parse_price(text, locale))
+        except PriceFormatError as e:
+            results.append(e)
+    return results
+
+
+class PriceGuard:
+    """
+    Holds back scraped prices too far from the product's last known one.
+    The suspect price is kept on the product's RefreshState; when the next
+    fetch reads it again it is taken as a real change and written.
+    """
+
+    def __init__(self, max_drop=MAX_DROP, max_rise=MAX_RISE):
+        self.max_drop = max_drop
+        self.max_rise = max_rise
+        self.held = []
+        self.confirmed = 0
+
+    def is_outlier(self, old_price, price):
+        if not old_price:
+            return False
+        ratio = Decimal(price) / Decimal(old_price)
+        return ratio < self.max_drop or ratio > self.max_rise
+
+    def check(self, product, price, state):
+        """Whether `price` may be written for `product`, given its RefreshState."""
+        if not self.is_outlier(product.price, price):
+            state.suspect_price = None
+            return True
+        if state.suspect_price is not None and state.suspect_price == Decimal(price).quantize(CENT):
+            state.suspect_price = None
+            self.confirmed += 1
+            return True
+        state.suspect_price = Decimal(price).quantize(CENT)
+        self.held.append((product, product.price, state.suspect_price))
+        logger.warning(f"Holding back {state.suspect_price} for {product} (was {product.price}) until it is seen again.")
+        return False
+
+    def lines(self):
+        if not self.held and not self.confirmed:
+            return
+        yield f"Held back {len(self.held)} suspect prices, accepted {self.confirmed} seen twice"
+        for product, old_price, price in self.held:
+            yield f"  {product}: {old_price} -> {price}"
@@ -0,0 +1,186 @@
+import json
+from pathlib import Path
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .blocking import DEFAULT_RULES
+from .catalog import CATEGORY_MODELS, ProductIndex, ProductSpec
+from .prices import DEFAULT_LOCALE, LOCALES
+from .waits import DEFAULT_TIMEOUTS, TimeoutProfile
+
+# The retailers to scrape, by name. Each one sets its price_selector and,
+# optionally, a click_selector and skip_selectors, how to fetch its pages
+# ("browser", or "http" for prices in the server-rendered HTML), how many
+# workers may load its pages at once (concurrency), its TimeoutProfile, the
+# locale its prices are written in and resource_rules adding block_types,
+# deny_domains or allow_domains to the default ResourceRules.
+# Its "products" identify ours by category, weight, variant, brand, form and
+# name; any other product value fills in the selector templates. A
+# "listing" scrapes every product of the given brands at its own URL.
+REGISTRY_PATH = Path(__file__).with_name('retailers.json')
+FETCH_MODES = ('browser', 'http')
+# Product keys that identify the product; every other key fills in the
+# retailer's selector templates.
+SPEC_KEYS = ('category', 'weight', 'variant', 'brand', 'form', 'name')
+RETAILER_KEYS = {
+    'concurrency', 'fetch', 'timeouts', 'locale', 'brand', 'price_selector', 'click_selector', 'skip_selectors',
+    'products', 'listing', 'resource_rules',
+}
+RULE_KEYS = ('block_types', 'deny_domains', 'allow_domains')
+
+
+class RetailerPlan:
+    """
+    One retailer, compiled: how to fetch its pages, and every product spec
+    with its selectors already filled in.
+    """
+
+    def __init__(self, name, fetch='browser', concurrency=None, timeouts=DEFAULT_TIMEOUTS, locale=DEFAULT_LOCALE,
+                 rules=DEFAULT_RULES):
+        self.name = name
+        self.fetch = fetch
+        self.concurrency = concurrency
+        self.timeouts = timeouts
+        self.locale = locale
+        self.rules = rules
+        self.entries = []
+        self.listings = []
+
+    def add_spec(self, spec, selectors):
+        self.entries.append((spec, selectors))
+
+    def add_listing(self, category, brand_code, selectors):
+        self.listings.append((category, brand_code, selectors))
+
+
+class FetchPlan:
+    """
+    Every retailer's compiled scrape, in registry order. resolve() turns it
+    into (retailer, product, selectors) fetches with one product query per
+    model for the whole plan.
+    """
+
+    def __init__(self, retailers):
+        self.retailers = {retailer.name: retailer for retailer in retailers}
+
+    @property
+    def concurrency(self):
+        return {name: retailer.concurrency for name, retailer in self.retailers.items() if retailer.concurrency}
+
+    def strategy(self, retailer):
+        return self.retailers[retailer].fetch if retailer in self.retailers else 'browser'
+
+    def timeouts(self, retailer):
+        return self.retailers[retailer].timeouts if retailer in self.retailers else DEFAULT_TIMEOUTS
+
+    def locale(self, retailer):
+        return self.retailers[retailer].locale if retailer in self.retailers else DEFAULT_LOCALE
+
+    def rules(self, retailer):
+        return self.retailers[retailer].rules if retailer in self.retailers else DEFAULT_RULES
+
+    def resolve(self):
+        """Return the fetches to run and the (retailer, spec, reason) of every spec left unresolved."""
+        index = ProductIndex.load(
+            [spec for retailer in self.retailers.values() for spec, _ in retailer.entries],
+            [(category, code) for retailer in self.retailers.values() for category, code, _ in retailer.listings],
+        )
+        fetches = []
+        unresolved = []
+        for retailer in self.retailers.values():
+            for spec, selectors in retailer.entries:
+                product = index.resolve(spec)
+                if product:
+                    fetches.append((retailer.name, product, selectors))
+                else:
+                    unresolved.append(retailer.name)
+            for category, brand_code, selectors in retailer.listings:
+                fetches.extend((retailer.name, product, selectors) for product in index.listed(category, brand_code))
+        missing = [(name, spec, reason) for name, (spec, reason) in zip(unresolved, index.missing)]
+        return fetches, missing
+
+
+def load_registry(path=REGISTRY_PATH):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)['retailers']
+
+
+def fill(template, params, retailer):
+    if template is None:
+        return None
+    try:
+        return template.format(**params)
+    except (KeyError, IndexError) as e:
+        raise ImproperlyConfigured(f"Retailer {retailer}: selector {template!r} needs a product value for {e}")
+
+
+def compile_rules(name, config):
+    if config is None:
+        return DEFAULT_RULES
+    if not isinstance(config, dict) or set(config) - set(RULE_KEYS):
+        raise ImproperlyConfigured(f"Retailer {name}: resource_rules may only set {', '.join(RULE_KEYS)}")
+    for key, values in config.items():
+        if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+            raise ImproperlyConfigured(f"Retailer {name}: resource_rules {key} must be a list of strings")
+    return DEFAULT_RULES.extend(**config)
+
+
+def compile_retailer(name, config):
+    unknown = set(config) - RETAILER_KEYS
+    if unknown:
+        raise ImproperlyConfigured(f"Retailer {name}: unknown settings {', '.join(sorted(unknown))}")
+    if 'price_selector' not in config:
+        raise ImproperlyConfigured(f"Retailer {name}: price_selector is required")
+    fetch = config.get('fetch', 'browser')
+    if fetch not in FETCH_MODES:
+        raise ImproperlyConfigured(f"Retailer {name}: fetch must be one of {', '.join(FETCH_MODES)}")
+    locale = config.get('locale', DEFAULT_LOCALE)
+    if locale not in LOCALES:
+        raise ImproperlyConfigured(f"Retailer {name}: locale must be one of {', '.join(LOCALES)}")
+    try:
+        timeouts = TimeoutProfile(**config['timeouts']) if 'timeouts' in config else DEFAULT_TIMEOUTS
+    except TypeError as e:
+        raise ImproperlyConfigured(f"Retailer {name}: invalid timeouts: {e}")
+
+    rules = compile_rules(name, config.get('resource_rules'))
+
+    retailer = RetailerPlan(
+        name, fetch=fetch, concurrency=config.get('concurrency'), timeouts=timeouts, locale=locale, rules=rules,
+    )
+    skip_selectors = config.get('skip_selectors') or None
+
+    for product in config.get('products', []):
+        params = {key: value for key, value in product.items() if key not in SPEC_KEYS}
+        category = product.get('category', 'protein_powder')
+        brand = product.get('brand', config.get('brand'))
+        if category not in CATEGORY_MODELS or brand is None or 'weight' not in product or 'variant' not in product:
+            raise ImproperlyConfigured(f"Retailer {name}: product {product} needs a valid category, brand, weight and variant")
+        spec = ProductSpec(category, product['weight'], product['variant'], brand, form=product.get('form'), name=product.get('name'))
+        retailer.add_spec(spec, {
+            'price_selector': fill(config['price_selector'], params, name),
+            'click_selector': fill(config.get('click_selector'), params, name),
+            'skip_selectors': skip_selectors,
+        })
+
+    listing = config.get('listing')
+    if listing is not None:
+        brands = listing.get('brands')
+        if not isinstance(brands, list) or not brands:
+            raise ImproperlyConfigured(f"Retailer {name}: listing needs a non-empty list of brands")
+        selectors = {
+            'price_selector': fill(config['price_selector'], {}, name),
+            'click_selector': fill(config.get('click_selector'), {}, name),
+            'skip_selectors': skip_selectors,
+        }
+        for category in listing.get('categories', ['protein_powder']):
+            if category not in CATEGORY_MODELS:
+                raise ImproperlyConfigured(f"Retailer {name}: unknown category {category}")
+            for brand_code in brands:
+                retailer.add_listing(category, brand_code, selectors)
+
+    return retailer
+
+
+def compile_plan(registry):
+    """Validate a registry and compile it into a FetchPlan, failing on the first bad entry."""
+    return FetchPlan([compile_retailer(name, config) for name, config in registry.items()])
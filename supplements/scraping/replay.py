@@ -0,0 +1,100 @@
+import hashlib
+import json
+import threading
+import time
+from pathlib import Path
+
+from django.utils import timezone
+
+from .parsing import DEFAULT_PARSER, read_prices
+from .pool import ScrapeJob
+from .prices import DEFAULT_LOCALE
+
+
+class PageStore:
+    """
+    Rendered pages saved to disk, one HTML file per page key (retailer, URL,
+    click state) under a directory per retailer. A JSON file next to each
+    page records the key and the price selectors read off it, so captured
+    pages can be parsed again without the fetch plan that produced them.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def path(self, retailer, url, click_selector=None, skip_selectors=None):
+        key = ScrapeJob.page_key(retailer, url, click_selector, skip_selectors)
+        digest = hashlib.sha1(json.dumps(key).encode()).hexdigest()
+        return self.root / retailer / f"{digest}.html"
+
+    def save(self, job, html):
+        path = self.path(job.retailer, job.url, job.click_selector, job.skip_selectors)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(html, encoding='utf-8')
+        path.with_suffix('.json').write_text(json.dumps({
+            'retailer': job.retailer,
+            'url': job.url,
+            'click_selector': job.click_selector,
+            'skip_selectors': job.skip_selectors,
+            'price_selectors': [target.price_selector for target in job.targets],
+            'captured_at': timezone.now().isoformat(),
+        }, indent=2), encoding='utf-8')
+        return path
+
+    def has(self, retailer, url, click_selector=None, skip_selectors=None):
+        return self.path(retailer, url, click_selector, skip_selectors).exists()
+
+    def load(self, job):
+        """The captured HTML of the job's page, or None if it was never captured."""
+        path = self.path(job.retailer, job.url, job.click_selector, job.skip_selectors)
+        if not path.exists():
+            return None
+        return path.read_text(encoding='utf-8')
+
+    def pages(self):
+        """(metadata, html) of every captured page, by retailer."""
+        for meta_path in sorted(self.root.glob('*/*.json')):
+            html_path = meta_path.with_suffix('.html')
+            if html_path.exists():
+                yield json.loads(meta_path.read_text(encoding='utf-8')), html_path.read_text(encoding='utf-8')
+
+    def job(self, meta):
+        """A ScrapeJob for a captured page, with its recorded price selectors as targets."""
+        job = ScrapeJob(meta['retailer'], meta['url'], meta['click_selector'], meta['skip_selectors'])
+        for selector in meta['price_selectors']:
+            job.add_target(None, selector)
+        return job
+
+
+class ReplaySession:
+    """Stands in for a WorkerSession when pages come from a PageStore."""
+
+    def quit(self):
+        pass
+
+
+class ReplayFetcher:
+    """
+    A pool fetch that serves every page from a PageStore instead of loading
+    it, adding up the time spent parsing. Pages never captured read as no
+    prices at all. Prices are read in their retailer's locale when a plan
+    is given.
+    """
+
+    def __init__(self, store, parser=DEFAULT_PARSER, plan=None):
+        self.store = store
+        self.parser = parser
+        self.plan = plan
+        self._lock = threading.Lock()
+        self.parse_seconds = 0.0
+
+    def __call__(self, session, job):
+        html = self.store.load(job)
+        if html is None:
+            return [None] * len(job.targets)
+        started = time.perf_counter()
+        locale = self.plan.locale(job.retailer) if self.plan else DEFAULT_LOCALE
+        prices = read_prices(html, job, self.parser, locale, warn=False)
+        with self._lock:
+            self.parse_seconds += time.perf_counter() - started
+        return prices
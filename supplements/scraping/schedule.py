@@ -0,0 +1,145 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
+
+from supplements.models import RankingSnapshot, RefreshState
+
+from .catalog import CATEGORY_MODELS
+from .pool import ScrapeJob
+
+# A product is due after an interval between these two bounds: the more
+# often its price changes, the closer to MIN_INTERVAL.
+MIN_INTERVAL = timedelta(hours=3)
+MAX_INTERVAL = timedelta(hours=48)
+# Weight of the latest fetch in the volatility moving average.
+VOLATILITY_ALPHA = 0.3
+# Products in the first POPULAR_RANK groups of a ranking page get the most
+# traffic; they are due POPULAR_FACTOR times as often and go first.
+POPULAR_RANK = 10
+POPULAR_FACTOR = 2
+
+
+def popular_products():
+    """(model, pk) of every product near the top of a stored ranking."""
+    popular = set()
+    for category, payload in RankingSnapshot.objects.values_list('category', 'payload'):
+        model = CATEGORY_MODELS[category]
+        for group in payload[:POPULAR_RANK]:
+            popular.update((model, product['id']) for product in group)
+    return popular
+
+
+class RefreshScheduler:
+    """
+    Picks which pages an incremental refresh loads. A product is due once
+    its interval has passed since its last successful fetch; due pages are
+    taken most overdue first, weighted by traffic and volatility, until the
+    page budget is spent. Every product on a chosen page is refreshed, as
+    the page load is paid for anyway.
+    """
+
+    def __init__(self, states=None, popular=frozenset(), now=None):
+        self.states = states or {}
+        self.popular = popular
+        self.now = now or timezone.now()
+        self.touched = set()
+        self.pages_total = self.pages_due = self.pages_selected = 0
+
+    @classmethod
+    def load(cls, now=None):
+        content_types = ContentType.objects.get_for_models(*CATEGORY_MODELS.values())
+        models = {content_type.id: model for model, content_type in content_types.items()}
+        states = {
+            (models[state.content_type_id], state.object_id): state
+            for state in RefreshState.objects.filter(content_type__in=content_types.values())
+        }
+        return cls(states, popular_products(), now)
+
+    def state(self, product):
+        key = (type(product), product.pk)
+        if key not in self.states:
+            self.states[key] = RefreshState(
+                content_type=ContentType.objects.get_for_model(product),
+                object_id=product.pk,
+            )
+        self.touched.add(key)
+        return self.states[key]
+
+    def is_popular(self, product):
+        return (type(product), product.pk) in self.popular
+
+    def interval(self, product):
+        state = self.states.get((type(product), product.pk))
+        volatility = state.volatility if state else RefreshState._meta.get_field('volatility').default
+        interval = MAX_INTERVAL - (MAX_INTERVAL - MIN_INTERVAL) * min(max(volatility, 0.0), 1.0)
+        return interval / POPULAR_FACTOR if self.is_popular(product) else interval
+
+    def priority(self, product):
+        """How overdue the product is, in intervals, weighted by traffic and volatility; 0 when not due."""
+        state = self.states.get((type(product), product.pk))
+        if state is None or state.last_success_at is None:
+            return float('inf')
+        overdue = (self.now - state.last_success_at) / self.interval(product)
+        if overdue < 1:
+            return 0.0
+        weight = (1 + state.volatility) * (POPULAR_FACTOR if self.is_popular(product) else 1)
+        return overdue * weight / (1 + state.failures)
+
+    def select(self, fetches, budget=None, full=False):
+        """
+        The (retailer, product, selectors) fetches to run: every product on
+        the highest-priority pages with something due, at most `budget`
+        pages. `full` takes every page regardless of staleness.
+        """
+        pages = defaultdict(list)
+        for fetch in fetches:
+            retailer, product, selectors = fetch
+            key = ScrapeJob.page_key(
+                retailer, product.url, selectors.get('click_selector'), selectors.get('skip_selectors'),
+            )
+            pages[key].append(fetch)
+
+        ranked = []
+        for order, page in enumerate(pages.values()):
+            priority = max(self.priority(product) for _, product, _ in page)
+            if priority > 0:
+                self.pages_due += 1
+            if full or priority > 0:
+                ranked.append((-priority, order, page))
+        ranked.sort(key=lambda item: item[:2])
+        if budget is not None:
+            ranked = ranked[:budget]
+
+        self.pages_total += len(pages)
+        self.pages_selected += len(ranked)
+        return [fetch for _, _, page in ranked for fetch in page]
+
+    def record(self, product, price_found, changed=False):
+        """Note a fetch of `product`: whether a price was read, and whether it was new."""
+        state = self.state(product)
+        if not price_found:
+            state.failures += 1
+            return
+        state.checks += 1
+        state.failures = 0
+        state.last_success_at = self.now
+        state.volatility = (1 - VOLATILITY_ALPHA) * state.volatility + VOLATILITY_ALPHA * (1.0 if changed else 0.0)
+        if changed:
+            state.last_change_at = self.now
+
+    def save(self):
+        states = [self.states[key] for key in self.touched]
+        RefreshState.objects.bulk_create([state for state in states if state.pk is None])
+        RefreshState.objects.bulk_update(
+            [state for state in states if state.pk is not None],
+            ['last_success_at', 'last_change_at', 'checks', 'failures', 'volatility', 'suspect_price'],
+        )
+        self.touched.clear()
+
+    def lines(self):
+        yield (
+            f"Scheduled {self.pages_selected} of {self.pages_total} pages "
+            f"({self.pages_due} with stale products)"
+        )
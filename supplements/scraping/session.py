@@ -0,0 +1,50 @@
+from .http import new_http_session
+
+
+class WorkerSession:
+    """
+    The fetch resources owned by one pool worker. The browser and the HTTP
+    session are only started the first time a fetch asks for them, so a
+    worker that only serves plain-HTTP pages never launches a browser.
+    Browsers come from, and go back to, a BrowserSessionFactory, started
+    with the ResourceRules last given to use_rules().
+    """
+
+    def __init__(self, browsers):
+        self.browsers = browsers
+        self.rules = None
+        self._browser = None
+        self._http = None
+
+    def use_rules(self, rules):
+        """Block by `rules` from now on, handing back a browser started with other rules."""
+        if rules != self.rules:
+            self.release_browser()
+            self.rules = rules
+
+    @property
+    def browser(self):
+        if self._browser is None:
+            self._browser = self.browsers.acquire(self.rules)
+        return self._browser
+
+    @property
+    def http(self):
+        if self._http is None:
+            self._http = new_http_session()
+        return self._http
+
+    @property
+    def browser_started(self):
+        return self._browser is not None
+
+    def release_browser(self):
+        if self._browser is not None:
+            self.browsers.release(self._browser)
+            self._browser = None
+
+    def quit(self):
+        self.release_browser()
+        if self._http is not None:
+            self._http.close()
+            self._http = None
@@ -0,0 +1,138 @@
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.utils import timezone
+
+from supplements.models import FetchMetric, ScrapeRun
+
+from .waits import PhaseTimer
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of `values`; 0 when there are none."""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class FetchRecord:
+    """
+    Everything measured about one page fetch. Measures phases like a
+    BoundTimer, and adds each measurement to the run-wide `timer` as well.
+    """
+
+    def __init__(self, job, timer=None):
+        self.retailer = job.retailer
+        self.url = job.url
+        self.timer = timer
+        self.seconds = dict.fromkeys(PhaseTimer.PHASES, 0.0)
+        self.strategy = 'browser'
+        self.bytes = 0
+        self.attempts = 0
+        self.selectors_found = 0
+        self.selectors_missing = 0
+        self.price_changes = 0
+        self.price_delta = Decimal('0')
+
+    @contextmanager
+    def measure(self, phase):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            self.seconds[phase] += elapsed
+            if self.timer:
+                self.timer.add(phase, elapsed)
+
+    def metric(self, run):
+        return FetchMetric(
+            run=run,
+            retailer=self.retailer,
+            url=self.url[:500],
+            strategy=self.strategy,
+            navigation_ms=round(self.seconds['navigation'] * 1000),
+            wait_ms=round(self.seconds['wait'] * 1000),
+            work_ms=round(self.seconds['work'] * 1000),
+            parse_ms=round(self.seconds['parse'] * 1000),
+            bytes=self.bytes,
+            attempts=self.attempts,
+            selectors_found=self.selectors_found,
+            selectors_missing=self.selectors_missing,
+            price_changes=self.price_changes,
+            price_delta=self.price_delta,
+        )
+
+
+class RunTelemetry:
+    """
+    Collects a FetchRecord per page from the pool workers and stores them
+    as one ScrapeRun with its FetchMetric rows.
+    """
+
+    def __init__(self, workers=1):
+        self._lock = threading.Lock()
+        self.run = ScrapeRun.objects.create(workers=workers)
+        self.records = []
+        self.by_target = {}
+
+    def add(self, record, targets):
+        with self._lock:
+            self.records.append(record)
+            for target in targets:
+                self.by_target[id(target)] = record
+
+    def price_changed(self, target, old_price, new_price):
+        record = self.by_target.get(id(target))
+        if record is None:
+            return
+        record.price_changes += 1
+        record.price_delta += abs(new_price - (old_price if old_price is not None else new_price))
+
+    def save(self, prices_updated=0):
+        FetchMetric.objects.bulk_create([record.metric(self.run) for record in self.records], batch_size=500)
+        self.run.finished_at = timezone.now()
+        self.run.pages = len(self.records)
+        self.run.prices_updated = prices_updated
+        self.run.save(update_fields=['finished_at', 'pages', 'prices_updated'])
+        return self.run
+
+
+def retailer_summary(run):
+    """Per-retailer latency percentiles and totals of a run's fetches, by retailer name."""
+    fetches = defaultdict(list)
+    for metric in run.fetches.exclude(strategy='skipped'):
+        fetches[metric.retailer].append(metric)
+
+    summary = {}
+    for retailer, metrics in fetches.items():
+        totals = [metric.total_ms for metric in metrics]
+        found = sum(metric.selectors_found for metric in metrics)
+        selectors = found + sum(metric.selectors_missing for metric in metrics)
+        summary[retailer] = {
+            'pages': len(metrics),
+            'p50_ms': percentile(totals, 50),
+            'p95_ms': percentile(totals, 95),
+            'wait_p50_ms': percentile([metric.wait_ms for metric in metrics], 50),
+            'parse_p50_ms': percentile([metric.parse_ms for metric in metrics], 50),
+            'kb_per_page': sum(metric.bytes for metric in metrics) / len(metrics) / 1000,
+            'retries': sum(max(0, metric.attempts - 1) for metric in metrics),
+            'hit_rate': found / selectors * 100 if selectors else 0.0,
+            'price_changes': sum(metric.price_changes for metric in metrics),
+        }
+    return summary
+
+
+def summary_lines(run):
+    yield f"{run}: {run.pages} pages, {run.prices_updated} prices updated"
+    for retailer, stats in sorted(retailer_summary(run).items()):
+        yield (
+            f"  {retailer}: p50 {stats['p50_ms']}ms, p95 {stats['p95_ms']}ms, parse p50 {stats['parse_p50_ms']}ms, "
+            f"{stats['kb_per_page']:.0f} kB/page, "
+            f"{stats['hit_rate']:.0f}% selectors found, {stats['retries']} retries"
+        )
@@ -0,0 +1,87 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class TimeoutProfile:
+    """
+    How long to wait on a retailer, in seconds.
+
+    page_load: navigation, up to the load event.
+    element:   a selector we need (price, click target) to appear.
+    optional:  a selector that may never appear (cookie banners, pop-ups).
+    settle:    the price to change after clicking a variant; an unchanged
+               price is valid when the clicked variant was already selected.
+    """
+
+    def __init__(self, page_load=30, element=10, optional=3, settle=2):
+        self.page_load = page_load
+        self.element = element
+        self.optional = optional
+        self.settle = settle
+
+    def ms(self, name):
+        """The named timeout in milliseconds, as Playwright expects."""
+        return getattr(self, name) * 1000
+
+
+DEFAULT_TIMEOUTS = TimeoutProfile()
+
+
+class PhaseTimer:
+    """
+    Thread-safe totals of time spent navigating, waiting for the page to be
+    ready, doing actual work on it (clicks, serialising), and parsing prices
+    out of what it returned, per key.
+    """
+
+    PHASES = ('navigation', 'wait', 'work', 'parse')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.totals = defaultdict(lambda: dict.fromkeys(self.PHASES, 0.0))
+
+    @contextmanager
+    def measure(self, key, phase):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(key, phase, time.monotonic() - started)
+
+    def add(self, key, phase, seconds):
+        with self._lock:
+            self.totals[key][phase] += seconds
+
+    def bind(self, key):
+        return BoundTimer(self, key)
+
+    def total(self, phase):
+        return sum(totals[phase] for totals in self.totals.values())
+
+    def lines(self):
+        overall = sum(self.total(phase) for phase in self.PHASES)
+        waiting = self.total('wait') / overall * 100 if overall else 0.0
+        yield (
+            f"Spent {self.total('navigation'):.1f}s navigating, {self.total('wait'):.1f}s waiting, "
+            f"{self.total('work'):.1f}s working and {self.total('parse'):.1f}s parsing ({waiting:.0f}% waiting)"
+        )
+        for key in sorted(self.totals, key=str):
+            totals = self.totals[key]
+            yield (
+                f"  {key}: {totals['navigation']:.1f}s navigating, {totals['wait']:.1f}s waiting, "
+                f"{totals['work']:.1f}s working, {totals['parse']:.1f}s parsing"
+            )
+
+
+class BoundTimer:
+    def __init__(self, timer, key):
+        self.timer = timer
+        self.key = key
+
+    def measure(self, phase):
+        return self.timer.measure(self.key, phase)
+
+    def add(self, phase, seconds):
+        self.timer.add(self.key, phase, seconds)
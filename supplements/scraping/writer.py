@@ -0,0 +1,62 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+
+from supplements.cache import bump_catalog_version
+from supplements.history import record_price_changes
+from supplements.money import CENT
+
+DEFAULT_BATCH_SIZE = 100
+
+
+def to_cents(price):
+    return Decimal(str(price)).quantize(CENT)
+
+
+class PriceWriter:
+    """
+    Collects scraped prices and writes them with bulk_update(), one short
+    transaction per batch of `batch_size` products per model. Products whose
+    price did not change are never written. Each write also records the
+    change in the price history and refreshes the stored per-unit prices.
+    """
+
+    fields = ['price']
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.pending = defaultdict(list)
+        self.updated = 0
+        self.unchanged = 0
+
+    def add(self, product, price, source=''):
+        """Queue `product` for writing if `price` differs; return whether it did."""
+        price = to_cents(price)
+        old_price = None if product.price is None else to_cents(product.price)
+        if old_price == price:
+            self.unchanged += 1
+            return False
+
+        product.price = price
+        product.update_derived_prices()
+        model = type(product)
+        self.pending[model].append((product, old_price, price, source))
+        if len(self.pending[model]) >= self.batch_size:
+            self.flush_model(model)
+        return True
+
+    def flush_model(self, model):
+        changes = self.pending.pop(model, [])
+        if not changes:
+            return
+        with transaction.atomic():
+            fields = [*self.fields, *model.derived_price_fields]
+            model.objects.bulk_update([product for product, *_ in changes], fields, batch_size=self.batch_size)
+            record_price_changes(changes)
+            bump_catalog_version()
+        self.updated += len(changes)
+
+    def flush(self):
+        for model in list(self.pending):
+            self.flush_model(model)
@@ -0,0 +1,63 @@
+from itertools import count
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .cache import bump_catalog_version
+from .models import Brand, Creatine, ProteinPowder
+from .rankings import rebuild_ranking_snapshots
+
+# Orders catalog changes and the rebuilds that cover them.
+CHANGES = count()
+
+
+@receiver(pre_save, sender=ProteinPowder)
+@receiver(pre_save, sender=Creatine)
+def fill_loaded_unit_prices(sender, instance, raw=False, **kwargs):
+    """
+    Fixtures are saved raw, past the model's save(), and may leave out the
+    stored per-unit prices; work them out from the loaded price and weight.
+    """
+    if raw:
+        instance.update_derived_prices()
+
+
+@receiver(post_save, sender=ProteinPowder)
+@receiver(post_save, sender=Creatine)
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=ProteinPowder)
+@receiver(post_delete, sender=Creatine)
+@receiver(post_delete, sender=Brand)
+def catalog_changed(sender, **kwargs):
+    """
+    Keep the ranking snapshots and cached pages in line with edits made
+    outside the price updater, such as the admin. The updater writes with
+    bulk_update, which sends no signals, and rebuilds once at the end of its
+    run instead. Fixtures being loaded are left alone.
+    """
+    if kwargs.get('raw'):
+        return
+    bump_catalog_version()
+    rebuild_on_commit(kwargs.get('using'))
+
+
+def rebuild_on_commit(using=None):
+    """
+    Rebuild the snapshots once the current transaction commits, once per
+    transaction however many products it saves or deletes. Every change
+    queues a callback numbered in order; the first to run rebuilds, which
+    covers every change queued before it, and the rest see that and return.
+    Callbacks of a rolled-back transaction never run, so nothing is left
+    pending.
+    """
+    connection = transaction.get_connection(using)
+    queued = next(CHANGES)
+
+    def rebuild():
+        if getattr(connection, 'catalog_rebuilt_after', -1) >= queued:
+            return
+        connection.catalog_rebuilt_after = next(CHANGES)
+        rebuild_ranking_snapshots()
+
+    transaction.on_commit(rebuild, using=using)
@@ -0,0 +1,41 @@
+from django import template
+from django.core.cache import cache
+
+from supplements.cache import PAGE_TTL, catalog_version, count
+
+register = template.Library()
+
+
+class CatalogCacheNode(template.Node):
+    def __init__(self, nodelist, name, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        parts = [str(var.resolve(context)) for var in self.vary_on]
+        key = f"catalog:fragment:{catalog_version()}:{self.name}:{':'.join(parts)}"
+        value = cache.get(key)
+        if value is not None:
+            count('fragment', 'hit')
+            return value
+
+        count('fragment', 'miss')
+        value = self.nodelist.render(context)
+        cache.set(key, value, PAGE_TTL)
+        return value
+
+
+@register.tag
+def catalog_cache(parser, token):
+    """
+    Cache a template fragment until the catalog version changes:
+
+        {% catalog_cache "card" product.id %} ... {% endcatalog_cache %}
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires a fragment name.")
+    nodelist = parser.parse(('endcatalog_cache',))
+    parser.delete_first_token()
+    return CatalogCacheNode(nodelist, bits[1].strip('"\''), [parser.compile_filter(bit) for bit in bits[2:]])
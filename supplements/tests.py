@@ -1,3 +1,1458 @@
-from django.test import TestCase
+import datetime
+import json
+import random
+import tempfile
+import threading
+import time
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+from decimal import Decimal
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+from selenium.common.exceptions import WebDriverException
+
+from .management.commands.fetch_product import read_urls
+from .management.commands.update_product_prices import MAX_ATTEMPTS, Command, FetchContext, fetch_prices
+from .cache import bump_catalog_version, cache_stats, catalog_version, stats_counter
+from .history import record_price_changes
+from .models import (
+    Brand,
+    Creatine,
+    DailyPrice,
+    FetchMetric,
+    PriceObservation,
+    ProteinPowder,
+    RankingSnapshot,
+    RefreshState,
+    ScrapeRun,
+)
+from .rankings import get_ranking, get_top_creatines, get_top_protein_powders, rebuild_ranking_snapshots
+from .scraping.blocking import DEFAULT_RULES, BlockStats, PageResources, ResourceRules
+from .scraping.breaker import CircuitBreaker, RetailerBreakers, backoff_delay
+from .scraping.browser import PAGE_RESOURCES_SCRIPT, BrowserSessionFactory, geckodriver_path
+from .scraping.catalog import ProductIndex, ProductSpec
+from .scraping.http import FetchStats
+from .scraping.parsing import SELENIUM_EXTRACT_SCRIPT, HtmlParser, read_prices
+from .scraping.pool import BrowserPool, ScrapeJob
+from .scraping.prices import PriceFormatError, PriceGuard, parse_price, parse_prices
+from .scraping.registry import compile_plan, load_registry
+from .scraping.replay import PageStore, ReplayFetcher, ReplaySession
+from .scraping.schedule import RefreshScheduler
+from .scraping.session import WorkerSession
+from .scraping.telemetry import RunTelemetry, percentile, retailer_summary
+from .scraping.waits import PhaseTimer, TimeoutProfile
+from .scraping.writer import PriceWriter
+
+
+class FakeProduct:
+    def __init__(self, url):
+        self.url = url
+
+
+class FakeSession:
+    def __init__(self):
+        self.closed = False
+
+    def quit(self):
+        self.closed = True
+
+
+class FakeBrowserFactory:
+    def __init__(self):
+        self.created = 0
+        self.released = []
+
+    def acquire(self, rules=None):
+        self.created += 1
+        session = FakeSession()
+        session.rules = rules
+        return session
+
+    def release(self, browser):
+        self.released.append(browser)
+
+
+class BrowserPoolTests(SimpleTestCase):
+    def test_run_fetches_every_job_and_closes_sessions(self):
+        """
+        run() yields one result per submitted job and quits every browser
+        session it opened.
+        """
+        sessions = []
+
+        def session_factory():
+            session = FakeSession()
+            sessions.append(session)
+            return session
+
+        pool = BrowserPool(session_factory, workers=3)
+        for i in range(10):
+            pool.submit("shop", FakeProduct(f"https://shop/{i}"), price_selector="p")
+
+        results = list(pool.run(lambda session, job: [1.0] * len(job.targets)))
+
+        self.assertEqual(len(results), 10)
+        self.assertEqual(pool.summary.total, 10)
+        self.assertTrue(sessions)
+        self.assertTrue(all(session.closed for session in sessions))
+
+    def test_retailer_limit_caps_concurrency(self):
+        """
+        No more than the retailer's limit of jobs run at the same time, even
+        with more workers available.
+        """
+        lock = threading.Lock()
+        in_flight = {"shop": 0, "other": 0}
+        peak = {"shop": 0, "other": 0}
+
+        def fetch(session, job):
+            with lock:
+                in_flight[job.retailer] += 1
+                peak[job.retailer] = max(peak[job.retailer], in_flight[job.retailer])
+            time.sleep(0.01)
+            with lock:
+                in_flight[job.retailer] -= 1
+            return [1.0]
+
+        pool = BrowserPool(FakeSession, workers=4, retailer_limits={"shop": 1, "other": 3})
+        for i in range(6):
+            pool.submit("shop", FakeProduct(f"https://shop/{i}"))
+            pool.submit("other", FakeProduct(f"https://other/{i}"))
+        list(pool.run(fetch))
+
+        self.assertEqual(peak["shop"], 1)
+        self.assertLessEqual(peak["other"], 3)
+
+    def test_failed_fetch_yields_none(self):
+        """
+        A fetch that raises is reported as a failure instead of stopping the
+        pool.
+        """
+        def fetch(session, job):
+            raise RuntimeError("boom")
+
+        pool = BrowserPool(FakeSession, workers=2)
+        pool.submit("shop", FakeProduct("https://shop/1"))
+
+        self.assertEqual([price for _, price in pool.run(fetch)], [None])
+        self.assertEqual(pool.summary.failed["shop"], 1)
+
+    def test_products_sharing_a_page_are_fetched_once(self):
+        """
+        Products on the same URL and click state share one page load, and
+        each gets the price read with its own selector.
+        """
+        pool = BrowserPool(FakeSession, workers=2)
+        first = FakeProduct("https://shop/list")
+        second = FakeProduct("https://shop/list")
+        clicked = FakeProduct("https://shop/list")
+        pool.submit("shop", first, price_selector="#a")
+        pool.submit("shop", second, price_selector="#b")
+        pool.submit("shop", second, price_selector="#b")
+        pool.submit("shop", clicked, click_selector="label", price_selector="#a")
+
+        loads = []
+
+        def fetch(session, job):
+            loads.append(job.click_selector)
+            return [target.price_selector for target in job.targets]
+
+        results = [(target.product, price) for target, price in pool.run(fetch)]
+
+        self.assertEqual(sorted(loads, key=str), [None, "label"])
+        self.assertEqual(len(results), 3)
+        self.assertIn((second, "#b"), results)
+        self.assertEqual(pool.summary.total_pages, 2)
+
+
+class WorkerSessionTests(SimpleTestCase):
+    def test_browser_is_started_on_first_use_only(self):
+        """
+        A worker session never launches a browser unless a fetch asks for
+        one, and quit() hands the browser back to its factory.
+        """
+        factory = FakeBrowserFactory()
+        session = WorkerSession(factory)
+        session.http
+        self.assertFalse(session.browser_started)
+
+        self.assertIs(session.browser, session.browser)
+        session.quit()
+
+        self.assertEqual(factory.created, 1)
+        self.assertEqual(len(factory.released), 1)
+        self.assertFalse(session.browser_started)
+
+    def test_new_rules_swap_the_browser(self):
+        """
+        A fetch for a retailer with other resource rules hands the browser
+        back and gets one started with its rules; equal rules keep it.
+        """
+        factory = FakeBrowserFactory()
+        session = WorkerSession(factory)
+        session.use_rules(DEFAULT_RULES)
+        first = session.browser
+        session.use_rules(ResourceRules())
+        self.assertIs(session.browser, first)
+
+        images = DEFAULT_RULES.extend(allow_domains=["img.shop.pt"])
+        session.use_rules(images)
+
+        self.assertEqual(factory.released, [first])
+        self.assertEqual(session.browser.rules, images)
+
+
+class FetchStatsTests(SimpleTestCase):
+    def test_hit_rate_counts_fallbacks_as_attempts(self):
+        """
+        Pages that fell back to the browser count as missed HTTP attempts.
+        """
+        stats = FetchStats()
+        stats.record("wayup", "http")
+        stats.record("wayup", "http")
+        stats.record("wayup", "fallback")
+        stats.record("bulk", "browser")
+
+        summary = list(stats.lines())
+
+        self.assertIn("served 2 of 3 attempted pages (67% hit rate)", summary[0])
+        self.assertIn("2 pages needed the browser", summary[0])
+
+
+class BrowserSessionFactoryTests(SimpleTestCase):
+    def test_released_sessions_are_reused_and_closed(self):
+        """
+        A released browser is handed out again instead of starting a new
+        one, and close() quits every browser the factory started.
+        """
+        factory = BrowserSessionFactory()
+        factory.create = lambda rules: FakeSession()
+
+        with factory:
+            first = factory.acquire()
+            factory.release(first)
+            self.assertIs(factory.acquire(), first)
+            second = factory.acquire()
+
+        self.assertIsNot(first, second)
+        self.assertTrue(first.closed)
+        self.assertTrue(second.closed)
+
+    def test_sessions_are_kept_per_rule_set(self):
+        """
+        A released browser is only handed out again for the rules it was
+        started with, and a factory without rules starts every browser
+        without blocking.
+        """
+        images = DEFAULT_RULES.extend(allow_domains=["img.shop.pt"])
+        factory = BrowserSessionFactory()
+        factory.create = lambda rules: FakeSession()
+
+        with factory:
+            default = factory.acquire()
+            factory.release(default)
+            self.assertIsNot(factory.acquire(images), default)
+            self.assertIs(factory.acquire(DEFAULT_RULES), default)
+
+        self.assertIsNone(BrowserSessionFactory(rules=None).session_rules(images))
+        self.assertNotIn("permissions.default.image", factory.options(None).preferences)
+
+    def test_importing_the_updater_does_not_start_a_browser(self):
+        """
+        Loading the update_product_prices command (as `manage.py help` does)
+        does not resolve geckodriver or launch Firefox.
+        """
+        geckodriver_path.cache_clear()
+        with mock.patch("webdriver_manager.firefox.GeckoDriverManager") as manager:
+            import_module("supplements.management.commands.update_product_prices")
+        manager.assert_not_called()
+
+
+class ReadUrlsTests(SimpleTestCase):
+    def test_skips_blank_comment_and_duplicate_lines(self):
+        """
+        URL batches read from a file or stdin drop blank lines, comments and
+        repeats, and keep the input order.
+        """
+        lines = ["https://a\n", "\n", "# prozis\n", "  https://b  \n", "https://a\n"]
+        self.assertEqual(read_urls(lines), ["https://a", "https://b"])
+
+
+class PhaseTimerTests(SimpleTestCase):
+    def test_measures_time_per_key_and_phase(self):
+        """
+        Time spent inside measure() is added to the bound key and phase,
+        including when the measured block raises.
+        """
+        timer = PhaseTimer()
+        bound = timer.bind("shop")
+
+        with mock.patch("supplements.scraping.waits.time.monotonic", side_effect=[0.0, 2.0, 2.0, 2.5]):
+            with bound.measure("wait"):
+                pass
+            with self.assertRaises(ValueError):
+                with bound.measure("work"):
+                    raise ValueError
+
+        self.assertEqual(timer.totals["shop"], {"navigation": 0.0, "wait": 2.0, "work": 0.5, "parse": 0.0})
+        self.assertIn("(80% waiting)", next(timer.lines()))
+
+    def test_timeout_profile_converts_to_milliseconds(self):
+        """
+        Profiles are kept in seconds and converted for Playwright.
+        """
+        self.assertEqual(TimeoutProfile(element=4).ms("element"), 4000)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.breaker = CircuitBreaker(clock=lambda: self.now, rng=random.Random(0))
+
+    def test_opens_on_failure_rate_and_probes_after_cooldown(self):
+        """
+        Enough failures open the circuit; after the cooldown one probe is
+        let through, and its success closes the circuit again.
+        """
+        for success in (True, False, True, False):
+            self.breaker.record(success)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+
+        self.now = self.breaker.open_until
+        probe = self.breaker.allow()
+        self.assertTrue(probe)
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record(True, probe)
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+    def test_failed_probe_reopens_for_longer(self):
+        """
+        A failed probe reopens the circuit with a longer cooldown.
+        """
+        for _ in range(4):
+            self.breaker.record(False)
+        first = self.breaker.open_until - self.now
+        self.now = self.breaker.open_until
+        self.breaker.record(False, self.breaker.allow())
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertGreater(self.breaker.open_until - self.now, first)
+
+    def test_late_outcomes_do_not_decide_the_probe(self):
+        """
+        Fetches that started before the trip and finish while the circuit is
+        open or probing change nothing; only the probe's outcome counts.
+        """
+        stale = self.breaker.allow()
+        for _ in range(4):
+            self.breaker.record(False)
+        self.breaker.record(False, stale)
+        open_until = self.breaker.open_until
+
+        self.now = open_until
+        probe = self.breaker.allow()
+        self.breaker.record(True, stale)
+        self.breaker.record(False, stale)
+
+        self.assertEqual((self.breaker.state, self.breaker.open_until), (CircuitBreaker.HALF_OPEN, open_until))
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record(True, probe)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_backoff_is_jittered_and_capped(self):
+        """
+        Retry delays stay within the exponential bound for their attempt.
+        """
+        rng = random.Random(1)
+        for attempt in range(8):
+            self.assertLessEqual(backoff_delay(attempt, base=1, cap=20, rng=rng), min(20, 2 ** attempt))
+
+    def test_dead_retailer_stops_costing_page_loads(self):
+        """
+        Once a retailer's circuit opens, its remaining pages are skipped
+        without loading them.
+        """
+        plan = compile_plan({"shop": {"price_selector": "p"}})
+        breakers = RetailerBreakers()
+        jobs = [ScrapeJob("shop", f"https://shop.pt/{i}") for i in range(10)]
+        for job in jobs:
+            job.add_target(FakeProduct(job.url), "p")
+
+        with mock.patch(
+            "supplements.management.commands.update_product_prices.selenium_open", side_effect=OSError("down"),
+        ) as request, mock.patch("supplements.management.commands.update_product_prices.time.sleep"):
+            context = FetchContext(plan, breakers=breakers)
+            results = [fetch_prices(mock.Mock(), job, context) for job in jobs]
+
+        self.assertEqual(results, [[None]] * 10)
+        self.assertLess(request.call_count, MAX_ATTEMPTS * 2)
+        self.assertEqual(breakers.opened["shop"], 1)
+        self.assertEqual(breakers.refused["shop"], 9)
+
+
+class ResourceRulesTests(SimpleTestCase):
+    def test_blocks_heavy_types_and_trackers_but_not_the_page(self):
+        """
+        Images, fonts, media and tracker hosts are blocked; documents and
+        scripts from the shop itself are not.
+        """
+        self.assertTrue(DEFAULT_RULES.should_block("https://shop.pt/a.webp", "image"))
+        self.assertTrue(DEFAULT_RULES.should_block("https://www.googletagmanager.com/gtm.js", "script"))
+        self.assertFalse(DEFAULT_RULES.should_block("https://shop.pt/produto", "document"))
+        self.assertFalse(DEFAULT_RULES.should_block("https://shop.pt/app.js", "script"))
+
+    def test_allowed_domains_win_over_blocked_types(self):
+        """
+        A retailer can allow a host whose resources it needs.
+        """
+        rules = DEFAULT_RULES.extend(deny_domains=["cdn.shop.pt"], allow_domains=["img.shop.pt"])
+        self.assertFalse(rules.should_block("https://img.shop.pt/price.png", "image"))
+        self.assertTrue(rules.should_block("https://static.cdn.shop.pt/x.js", "script"))
+
+    def test_firefox_preferences_follow_the_rules(self):
+        """
+        Firefox gets the blocked types as preferences and the denied hosts
+        resolved to localhost.
+        """
+        preferences = DEFAULT_RULES.firefox_preferences()
+        self.assertEqual(preferences["permissions.default.image"], 2)
+        self.assertIn("connect.facebook.net", preferences["network.dns.localDomains"])
+        self.assertNotIn("permissions.default.image", ResourceRules(block_types=[]).firefox_preferences())
+
+    def test_block_stats_report_per_page(self):
+        """
+        Blocked requests are estimated from typical sizes and averaged per
+        page.
+        """
+        stats = BlockStats()
+        for _ in range(2):
+            resources = PageResources()
+            resources.block("image")
+            resources.load(10_000)
+            stats.record("shop", resources)
+
+        summary = list(stats.lines())
+
+        self.assertEqual(summary[0], "Blocked at least 2 requests, saving an estimated 0.1 MB")
+        self.assertIn("per page 1 blocked (~40 kB), 1 loaded (10 kB)", summary[1])
+
+
+def create_brand(code="shop"):
+    return Brand.objects.create(name=code.title(), code=code, website_url=f"https://{code}.pt")
+
+
+def create_protein_powder(brand, price, weight=1000, type="concentrate", name="Whey"):
+    return ProteinPowder.objects.create(
+        name=name, brand=brand, weight=weight, price=price, type=type, image="p.png", url="https://shop.pt/whey"
+    )
+
+
+def create_creatine(brand, price, weight=500, type="monohydrate", form="powder", name="Creatine"):
+    return Creatine.objects.create(
+        name=name, brand=brand, weight=weight, price=price, type=type, form=form,
+        image="c.png", url="https://shop.pt/creatine",
+    )
+
+
+class StoredUnitPriceTests(TestCase):
+    def test_price_per_kg_follows_price_and_weight(self):
+        """
+        price_per_kg is stored on create and kept current on save(), also
+        when only the price is in update_fields.
+        """
+        powder = create_protein_powder(create_brand(), "25.00", weight=500)
+        self.assertEqual(powder.price_per_kg, Decimal("50.00"))
+
+        powder.price = Decimal("20.00")
+        powder.save(update_fields=["price"])
+        powder.refresh_from_db()
+        self.assertEqual(powder.price_per_kg, Decimal("40.00"))
+        self.assertEqual(powder.get_price_per_kg(), 40.0)
+
+    def test_capsule_serving_price_uses_capsule_fill(self):
+        """
+        Capsules are priced per serving by the creatine they hold rather than
+        by their package weight.
+        """
+        creatine = Creatine(
+            name="Caps", brand=create_brand(), weight=200, price="12.00", type="monohydrate", form="capsules",
+            capsule_amount=120, capsule_weight=1000, image="c.png", url="https://shop.pt/caps",
+        )
+        creatine.save()
+        self.assertEqual(creatine.price_per_kg, Decimal("60.00"))
+        self.assertEqual(creatine.price_per_serving, Decimal("0.30"))
+
+    def test_bulk_created_products_are_ranked_by_price_per_kg(self):
+        """
+        Products written with bulk_create get their price_per_kg too, so the
+        rebuilt snapshots and the index list them by it.
+        """
+        brand = create_brand()
+        ProteinPowder.objects.bulk_create([
+            ProteinPowder(
+                name=name, brand=brand, weight=1000, price=price, type="concentrate",
+                image="p.png", url=f"https://shop.pt/{name}",
+            )
+            for name, price in (("Cheap", "20.00"), ("Dear", "30.00"))
+        ])
+        self.assertFalse(ProteinPowder.objects.filter(price_per_kg__isnull=True).exists())
+
+        rebuild_ranking_snapshots()
+
+        ranking = get_ranking("protein_powder", "concentrate")
+        self.assertEqual([group[0]["price_per_kg"] for group in ranking], [20.0, 30.0])
+        response = self.client.get(reverse("supplements:index"))
+        self.assertEqual([p.name for p in response.context["protein_powder_list"]], ["Cheap", "Dear"])
+
+    def test_queryset_update_recomputes_price_per_kg(self):
+        """
+        A queryset update() of the price or weight also rewrites the stored
+        per-unit prices of the rows it changed, even when it filtered on them.
+        """
+        brand = create_brand()
+        powder = create_protein_powder(brand, "25.00", weight=500)
+        creatine = create_creatine(brand, "15.00")
+
+        ProteinPowder.objects.filter(price="25.00").update(price="30.00")
+        Creatine.objects.update(weight=1000)
+
+        powder.refresh_from_db()
+        creatine.refresh_from_db()
+        self.assertEqual(powder.price_per_kg, Decimal("60.00"))
+        self.assertEqual(creatine.price_per_kg, Decimal("15.00"))
+
+    def test_loaded_fixtures_get_price_per_kg(self):
+        """
+        Raw saves made by loaddata fill in price_per_kg.
+        """
+        powder = ProteinPowder(
+            name="Loaded", brand=create_brand(), weight=2000, price="40.00", type="concentrate",
+            image="p.png", url="https://shop.pt/loaded",
+        )
+        powder.save_base(raw=True)
+        powder.refresh_from_db()
+        self.assertEqual(powder.price_per_kg, Decimal("20.00"))
+
+
+class ProductIndexTests(TestCase):
+    def test_specs_resolve_with_one_query_per_model(self):
+        """
+        A retailer's specs are resolved from one query per model, protein
+        powders match the "powder" form, and names pick between products of
+        the same size.
+        """
+        brand = create_brand("zumub")
+        whey = create_protein_powder(brand, "20.00", weight=1000)
+        professional = create_creatine(brand, "10.00", name="Professional")
+        create_creatine(brand, "8.00", name="Basic")
+        specs = [
+            ProductSpec("protein_powder", 1000, "concentrate", "zumub", form="powder"),
+            ProductSpec("creatine", 500, "monohydrate", "zumub", form="powder", name="Professional"),
+        ]
+
+        with self.assertNumQueries(2):
+            index = ProductIndex.load(specs)
+            resolved = [index.resolve(spec) for spec in specs]
+
+        self.assertEqual(resolved, [whey, professional])
+        self.assertEqual(index.missing, [])
+
+    def test_unresolved_specs_are_collected(self):
+        """
+        Specs matching no product, or several, resolve to None and are
+        collected with the reason.
+        """
+        brand = create_brand()
+        create_creatine(brand, "10.00", name="A")
+        create_creatine(brand, "12.00", name="B")
+        absent = ProductSpec("protein_powder", 2000, "isolate", "shop")
+        ambiguous = ProductSpec("creatine", 500, "monohydrate", "shop")
+
+        index = ProductIndex.load([absent, ambiguous])
+
+        self.assertIsNone(index.resolve(absent))
+        self.assertIsNone(index.resolve(ambiguous))
+        self.assertEqual(index.missing, [(absent, "not found"), (ambiguous, "2 matches")])
+
+
+class RetailerRegistryTests(TestCase):
+    def test_bundled_registry_compiles(self):
+        """
+        Every selector template in retailers.json is filled in at compile
+        time, and each retailer is planned once.
+        """
+        plan = compile_plan(load_registry())
+
+        self.assertIn("corposflex", plan.retailers)
+        self.assertEqual(plan.strategy("corposflex"), "http")
+        self.assertEqual(plan.timeouts("hsn").settle, 3)
+        for retailer in plan.retailers.values():
+            for _, selectors in retailer.entries:
+                self.assertNotIn("{", selectors["price_selector"])
+                self.assertNotIn("{", selectors["click_selector"] or "")
+
+    def test_plan_resolves_with_one_query_per_model(self):
+        """
+        Specs and listings of every retailer are resolved together, and
+        unresolved specs are returned with their retailer.
+        """
+        brand = create_brand("acme")
+        whey = create_protein_powder(brand, "20.00", weight=1000)
+        creatine = create_creatine(brand, "10.00")
+        plan = compile_plan({
+            "shop": {
+                "brand": "acme",
+                "click_selector": "label[for='{size}']",
+                "price_selector": "span.price",
+                "products": [
+                    {"weight": 1000, "variant": "concentrate", "size": "1kg"},
+                    {"weight": 2000, "variant": "concentrate", "size": "2kg"},
+                ],
+            },
+            "mall": {
+                "price_selector": "p.price",
+                "listing": {"brands": ["acme"], "categories": ["creatine"]},
+            },
+        })
+
+        with self.assertNumQueries(2):
+            fetches, missing = plan.resolve()
+
+        self.assertEqual([(retailer, product) for retailer, product, _ in fetches], [("shop", whey), ("mall", creatine)])
+        self.assertEqual(fetches[0][2]["click_selector"], "label[for='1kg']")
+        self.assertEqual([(retailer, spec.weight, reason) for retailer, spec, reason in missing], [("shop", 2000, "not found")])
+
+    def test_template_without_product_value_is_rejected(self):
+        """
+        A selector template naming a value the product does not set fails
+        when the registry is compiled.
+        """
+        with self.assertRaises(ImproperlyConfigured):
+            compile_plan({"shop": {"brand": "acme", "price_selector": "#p-{pid}", "products": [{"weight": 1, "variant": "blend"}]}})
+
+    def test_resource_rules_extend_the_defaults(self):
+        """
+        A retailer's resource_rules are added to the default rules, and
+        retailers without any share the default rule set.
+        """
+        plan = compile_plan({
+            "shop": {"price_selector": "p", "resource_rules": {"allow_domains": ["img.shop.pt"]}},
+            "mall": {"price_selector": "p"},
+        })
+
+        self.assertFalse(plan.rules("shop").should_block("https://img.shop.pt/price.png", "image"))
+        self.assertTrue(plan.rules("shop").should_block("https://www.clarity.ms/tag.js", "script"))
+        self.assertIs(plan.rules("mall"), DEFAULT_RULES)
+        for rules in ({"block": ["image"]}, {"deny_domains": "ads.shop.pt"}):
+            with self.subTest(rules=rules), self.assertRaises(ImproperlyConfigured):
+                compile_plan({"shop": {"price_selector": "p", "resource_rules": rules}})
+
+    def test_listing_needs_brands(self):
+        """
+        A listing without brands, or with none, is a configuration error.
+        """
+        for listing in ({}, {"brands": []}):
+            with self.subTest(listing=listing), self.assertRaises(ImproperlyConfigured):
+                compile_plan({"shop": {"price_selector": "p", "listing": listing}})
+
+
+class RefreshSchedulerTests(TestCase):
+    def setUp(self):
+        brand = create_brand()
+        self.powders = [create_protein_powder(brand, "20.00", weight=weight) for weight in (500, 1000, 2000)]
+        for powder in self.powders:
+            powder.url = f"https://shop.pt/{powder.weight}"
+
+    def fetches(self):
+        return [("shop", powder, {"price_selector": "p"}) for powder in self.powders]
+
+    def test_only_stale_products_are_fetched_most_overdue_first(self):
+        """
+        Products fetched within their interval are skipped; the rest are
+        taken most overdue first, never-fetched ones before all others.
+        """
+        now = timezone.now()
+        scheduler = RefreshScheduler(now=now)
+        fresh, stale, new = self.powders
+        scheduler.record(fresh, True)
+        scheduler.record(stale, True)
+        scheduler.state(stale).last_success_at = now - datetime.timedelta(days=3)
+
+        selected = [product for _, product, _ in scheduler.select(self.fetches())]
+
+        self.assertEqual(selected, [new, stale])
+        self.assertEqual((scheduler.pages_total, scheduler.pages_due), (3, 2))
+
+    def test_budget_caps_pages_and_shared_pages_come_along(self):
+        """
+        The budget counts page loads: products on a chosen page are fetched
+        with it, even when they are not due themselves.
+        """
+        scheduler = RefreshScheduler()
+        for powder in self.powders:
+            scheduler.record(powder, True)
+        self.powders[1].url = self.powders[0].url
+        scheduler.state(self.powders[0]).last_success_at -= datetime.timedelta(days=3)
+        scheduler.state(self.powders[2]).last_success_at -= datetime.timedelta(days=3)
+        scheduler.state(self.powders[2]).volatility = 0.0
+
+        selected = [product for _, product, _ in scheduler.select(self.fetches(), budget=1)]
+
+        self.assertEqual(selected, self.powders[:2])
+        self.assertEqual(len(RefreshScheduler().select(self.fetches(), full=True)), 3)
+
+    def test_volatile_products_are_due_sooner(self):
+        """
+        A product whose price keeps changing gets a shorter interval, and
+        the state is stored in bulk.
+        """
+        scheduler = RefreshScheduler()
+        steady, volatile, _ = self.powders
+        for _ in range(5):
+            scheduler.record(steady, True, changed=False)
+            scheduler.record(volatile, True, changed=True)
+        scheduler.save()
+
+        self.assertLess(scheduler.interval(volatile), scheduler.interval(steady))
+        state = RefreshScheduler.load().states[ProteinPowder, volatile.pk]
+        self.assertEqual(state.checks, 5)
+        self.assertGreater(state.volatility, 0.8)
+        self.assertEqual(RefreshState.objects.count(), 2)
+
+
+class TelemetryTests(TestCase):
+    def test_percentile_uses_nearest_rank(self):
+        """
+        Percentiles pick an observed value; an empty series is 0.
+        """
+        values = list(range(1, 101))
+        self.assertEqual((percentile(values, 50), percentile(values, 95)), (50, 95))
+        self.assertEqual(percentile([], 95), 0)
+
+    def test_fetches_are_stored_per_run_and_summarised(self):
+        """
+        Each page fetch is stored with how it was served, its bytes and the
+        selectors it matched, and summarised per retailer. Reading prices off
+        the HTML is timed as its own phase, in the run-wide timer too.
+        """
+        plan = compile_plan({"shop": {"fetch": "http", "price_selector": "p.price"}})
+        job = ScrapeJob("shop", "https://shop.pt/whey")
+        target = job.add_target(FakeProduct(job.url), "p.price")
+        telemetry = RunTelemetry(workers=2)
+        context = FetchContext(plan, telemetry=telemetry)
+        response = mock.Mock(text="<p class='price'>19,90€</p>", content=b"x" * 2048)
+
+        with mock.patch("supplements.management.commands.update_product_prices.http_get", return_value=response):
+            prices = fetch_prices(mock.Mock(), job, context)
+        telemetry.price_changed(target, Decimal("21.00"), Decimal("19.90"))
+        run = telemetry.save(prices_updated=1)
+
+        self.assertEqual(prices, [Decimal("19.90")])
+        metric = FetchMetric.objects.get(run=run)
+        self.assertEqual((metric.strategy, metric.bytes, metric.attempts), ("http", 2048, 1))
+        self.assertEqual((metric.selectors_found, metric.selectors_missing), (1, 0))
+        self.assertEqual(metric.price_delta, Decimal("1.10"))
+        self.assertEqual(retailer_summary(run)["shop"]["hit_rate"], 100.0)
+        self.assertGreater(context.timer.totals["shop"]["parse"], 0)
+        self.assertEqual(context.timer.totals["shop"]["work"], 0)
+
+    def test_compare_runs_reports_latency_changes(self):
+        """
+        compare_runs shows each retailer's latency and parse time in both
+        runs.
+        """
+        for total, parse in ((1000, 40), (500, 10)):
+            run = ScrapeRun.objects.create(pages=1)
+            FetchMetric.objects.create(
+                run=run, retailer="shop", url="https://shop.pt", strategy="browser", navigation_ms=total - parse,
+                parse_ms=parse, selectors_found=1,
+            )
+        out = StringIO()
+        call_command("compare_runs", stdout=out)
+
+        self.assertIn("shop: p50 1000 -> 500ms (-50%)", out.getvalue())
+        self.assertIn("parse p50 40 -> 10ms (-75%)", out.getvalue())
+
+
+class FakeDriver:
+    """A browser serving {url: {selector: text}}; other URLs fail to load."""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.url = None
+
+    def implicitly_wait(self, seconds):
+        pass
+
+    def set_page_load_timeout(self, seconds):
+        pass
+
+    def get(self, url):
+        if url not in self.pages:
+            raise WebDriverException(f"cannot load {url}")
+        self.url = url
+
+    def find_elements(self, by, selector):
+        return [selector] if selector in self.pages[self.url] else []
+
+    def execute_script(self, script, *args):
+        if script == SELENIUM_EXTRACT_SCRIPT:
+            return {key: self.pages[self.url].get(selector) for key, selector in args[0].items()}
+        if script == PAGE_RESOURCES_SCRIPT:
+            return {"loaded": 3, "bytes": 50_000, "blocked_images": 2}
+        return "complete"
+
+
+class RefreshCommandTests(TestCase):
+    """
+    update_product_prices end to end, with pages served over a mocked
+    http_get and by fake browsers.
+    """
+
+    def setUp(self):
+        brand = create_brand("acme")
+        self.products = {}
+        for key, weight, price in (
+            ("http", 1000, "20.00"), ("fallback", 2000, "40.00"), ("outlier", 500, "12.00"),
+            ("down1", 750, "15.00"), ("down2", 1500, "30.00"), ("down3", 2500, "50.00"),
+        ):
+            self.products[key] = ProteinPowder.objects.create(
+                name="Whey", brand=brand, weight=weight, price=price, type="concentrate", image="p.png",
+                url=f"https://shop.pt/{key}",
+            )
+        self.plan = compile_plan({
+            "web": {
+                "fetch": "http", "brand": "acme", "price_selector": "p.price",
+                "products": [{"weight": weight, "variant": "concentrate"} for weight in (1000, 2000, 500)],
+            },
+            "down": {
+                "brand": "acme", "price_selector": "p.price",
+                "products": [{"weight": weight, "variant": "concentrate"} for weight in (750, 1500, 2500)],
+            },
+        })
+        self.html = {
+            "https://shop.pt/http": "<p class='price'>18,00 €</p>",
+            "https://shop.pt/fallback": "<p class='loading'></p>",
+            "https://shop.pt/outlier": "<p class='price'>60,00 €</p>",
+        }
+        self.browsers = mock.Mock()
+        self.browsers.acquire.side_effect = lambda rules=None: FakeDriver({"https://shop.pt/fallback": {"p.price": "35,00 €"}})
+
+    def refresh(self):
+        def http_get(session, url, timer=None):
+            return mock.Mock(text=self.html[url], content=self.html[url].encode())
+
+        out = StringIO()
+        command = Command(stdout=out)
+        with mock.patch("supplements.management.commands.update_product_prices.http_get", side_effect=http_get), \
+                mock.patch("supplements.management.commands.update_product_prices.time.sleep") as sleep:
+            command.refresh(self.browsers, 1, self.plan)
+        return out.getvalue(), sleep
+
+    def state(self, key):
+        product = self.products[key]
+        return RefreshState.objects.get(object_id=product.pk, content_type__model="proteinpowder")
+
+    def test_refresh_writes_prices_and_records_the_run(self):
+        """
+        Server-rendered prices are read over HTTP and the rest in the
+        browser; a failing retailer is retried with backoff until its
+        circuit opens; an outlier is held back until it is read twice; and
+        the run, its fetches, the price history and the refresh states are
+        stored.
+        """
+        output, sleep = self.refresh()
+
+        prices = {key: ProteinPowder.objects.get(pk=product.pk).price for key, product in self.products.items()}
+        self.assertEqual(prices, {
+            "http": Decimal("18.00"), "fallback": Decimal("35.00"), "outlier": Decimal("12.00"),
+            "down1": Decimal("15.00"), "down2": Decimal("30.00"), "down3": Decimal("50.00"),
+        })
+        self.assertEqual(
+            sorted(PriceObservation.objects.filter(source="web").values_list("object_id", "price")),
+            sorted([(self.products["http"].pk, Decimal("18.00")), (self.products["fallback"].pk, Decimal("35.00"))]),
+        )
+
+        run = ScrapeRun.objects.get()
+        self.assertEqual((run.pages, run.prices_updated, run.workers), (6, 2, 1))
+        self.assertIsNotNone(run.finished_at)
+        metrics = {metric.url.rsplit("/", 1)[1]: metric for metric in run.fetches.all()}
+        self.assertEqual(
+            {key: (metric.strategy, metric.attempts) for key, metric in metrics.items()},
+            {
+                "http": ("http", 1), "fallback": ("fallback", 2), "outlier": ("http", 1),
+                "down1": ("browser", MAX_ATTEMPTS), "down2": ("browser", 1), "down3": ("skipped", 0),
+            },
+        )
+        self.assertEqual(metrics["fallback"].bytes, len(self.html["https://shop.pt/fallback"]) + 50_000)
+        self.assertEqual(metrics["fallback"].selectors_found, 1)
+        self.assertEqual(sleep.call_count, MAX_ATTEMPTS)
+
+        self.assertEqual((self.state("http").checks, self.state("http").failures), (1, 0))
+        self.assertIsNotNone(self.state("http").last_change_at)
+        self.assertEqual(self.state("outlier").suspect_price, Decimal("60.00"))
+        self.assertEqual(self.state("outlier").failures, 1)
+        self.assertEqual([self.state(key).failures for key in ("down1", "down2", "down3")], [1, 1, 1])
+        self.assertIn("Held back 1 suspect prices", output)
+        self.assertIn("down: opened 1 times, 2 pages skipped", output)
+
+    def test_next_refresh_fetches_stale_pages_and_confirms_the_outlier(self):
+        """
+        An incremental refresh skips pages read successfully last time, and
+        writes a held-back price once it is read again.
+        """
+        self.refresh()
+        output, _ = self.refresh()
+
+        run = ScrapeRun.objects.latest("pk")
+        self.assertEqual(
+            sorted(metric.url.rsplit("/", 1)[1] for metric in run.fetches.all()),
+            ["down1", "down2", "down3", "outlier"],
+        )
+        self.assertEqual(ProteinPowder.objects.get(pk=self.products["outlier"].pk).price, Decimal("60.00"))
+        self.assertIsNone(self.state("outlier").suspect_price)
+        self.assertIn("accepted 1 seen twice", output)
+
+
+class PriceWriterTests(TestCase):
+    def test_only_changed_prices_are_written(self):
+        """
+        Unchanged prices are skipped, and changed ones are written per model
+        in one bulk update.
+        """
+        brand = create_brand()
+        same = create_protein_powder(brand, "20.00")
+        changed = create_protein_powder(brand, "30.00", weight=2000)
+        creatine = create_creatine(brand, "10.00")
+
+        writer = PriceWriter()
+        self.assertFalse(writer.add(same, 20.0))
+        self.assertTrue(writer.add(changed, 27.5))
+        self.assertTrue(writer.add(creatine, "9.99"))
+        writer.flush()
+
+        self.assertEqual((writer.updated, writer.unchanged), (2, 1))
+        changed.refresh_from_db()
+        creatine.refresh_from_db()
+        self.assertEqual(changed.price, Decimal("27.50"))
+        self.assertEqual(changed.price_per_kg, Decimal("13.75"))
+        self.assertEqual(creatine.price, Decimal("9.99"))
+        self.assertEqual(creatine.price_per_kg, Decimal("19.98"))
+
+    def test_full_batches_are_flushed_as_they_fill(self):
+        """
+        A batch is written as soon as it reaches batch_size.
+        """
+        brand = create_brand()
+        powders = [create_protein_powder(brand, "10.00", weight=weight) for weight in (500, 1000, 2000)]
+
+        writer = PriceWriter(batch_size=2)
+        for powder in powders:
+            writer.add(powder, 11)
+
+        self.assertEqual(writer.updated, 2)
+        writer.flush()
+        self.assertEqual(writer.updated, 3)
+        self.assertEqual(set(ProteinPowder.objects.values_list("price", flat=True)), {Decimal("11.00")})
+
+
+class PriceHistoryTests(TestCase):
+    def test_changes_are_observed_and_rolled_up_per_day(self):
+        """
+        Each change adds an observation, and the day's row keeps the lowest,
+        highest and latest price, including the price before the change.
+        """
+        brand = create_brand()
+        powder = create_protein_powder(brand, "30.00")
+        morning = timezone.now().replace(hour=9)
+
+        record_price_changes([(powder, Decimal("30.00"), Decimal("25.00"), "shop")], observed_at=morning)
+        record_price_changes(
+            [(powder, Decimal("25.00"), Decimal("27.00"), "shop")],
+            observed_at=morning + datetime.timedelta(hours=3),
+        )
+
+        self.assertEqual(
+            list(powder.get_price_history().values_list("price", flat=True)),
+            [Decimal("25.00"), Decimal("27.00")],
+        )
+        daily = powder.daily_prices.get()
+        self.assertEqual(
+            (daily.min_price, daily.max_price, daily.close_price),
+            (Decimal("25.00"), Decimal("30.00"), Decimal("27.00")),
+        )
+
+    def test_writer_records_history_only_for_changes(self):
+        """
+        Prices the writer skips as unchanged leave no history behind.
+        """
+        brand = create_brand()
+        same = create_protein_powder(brand, "20.00")
+        changed = create_creatine(brand, "10.00")
+
+        writer = PriceWriter()
+        writer.add(same, "20.00", source="shop")
+        writer.add(changed, "8.50", source="shop")
+        writer.flush()
+
+        observation = PriceObservation.objects.get()
+        self.assertEqual((observation.product, observation.price, observation.source), (changed, Decimal("8.50"), "shop"))
+        self.assertEqual(DailyPrice.objects.count(), 1)
+
+
+class RankingTests(TestCase):
+    def test_groups_are_ranked_by_average_price_per_kg(self):
+        """
+        Products are grouped by brand and name, most expensive first, and
+        groups are ordered by their 100g-2500g average price per kg, falling
+        back to the most expensive size when no size is in that range.
+        """
+        a, b, c = create_brand("a"), create_brand("b"), create_brand("c")
+        create_protein_powder(a, "20.00", weight=1000)
+        create_protein_powder(a, "36.00", weight=2000)
+        create_protein_powder(a, "50.00", weight=5000)
+        create_protein_powder(b, "80.00", weight=5000)
+        create_protein_powder(c, "15.00", weight=500, name="Iso")
+        create_protein_powder(c, "1.00", weight=100, type="isolate")
+
+        with self.assertNumQueries(1):
+            ranking = get_top_protein_powders("concentrate")
+
+        self.assertEqual(
+            [[(p.brand.code, p.weight) for p in group] for group in ranking],
+            [[("b", 5000)], [("a", 5000), ("a", 2000), ("a", 1000)], [("c", 500)]],
+        )
+        self.assertEqual(ranking[1][1].formatted_price_per_kg, "18.00€/kg")
+        self.assertEqual(ranking[0][0].formatted_weight, "5kg")
+
+    def test_creatines_are_filtered_by_form_and_type(self):
+        """
+        Only creatines of the requested form and type are ranked.
+        """
+        brand = create_brand()
+        create_creatine(brand, "10.00", form="powder")
+        create_creatine(brand, "12.00", form="capsules")
+
+        ranking = get_top_creatines("capsules", "monohydrate")
+
+        self.assertEqual([[p.price for p in group] for group in ranking], [[Decimal("12.00")]])
+
+
+class RankingSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_one_rebuild_per_transaction(self):
+        """
+        Saving many products in one transaction queues a single rebuild.
+        """
+        with mock.patch("supplements.signals.rebuild_ranking_snapshots") as rebuild:
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    brand = create_brand()
+                    for price in ("20.00", "22.00", "24.00"):
+                        create_protein_powder(brand, price)
+                    with transaction.atomic():
+                        create_creatine(brand, "15.00")
+            self.assertEqual(rebuild.call_count, 1)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                create_protein_powder(brand, "30.00")
+            self.assertEqual(rebuild.call_count, 2)
+
+    def test_loading_fixtures_queues_no_rebuild(self):
+        """
+        Raw saves, as made by loaddata, leave the snapshots alone.
+        """
+        with self.captureOnCommitCallbacks() as callbacks:
+            post_save.send(ProteinPowder, instance=ProteinPowder(), created=True, raw=True, using="default")
+        self.assertEqual(callbacks, [])
+
+    def test_views_read_the_stored_snapshot(self):
+        """
+        Once built, a ranking is read with a single lookup and rendered
+        from the snapshot.
+        """
+        brand = create_brand()
+        create_protein_powder(brand, "20.00")
+        rebuild_ranking_snapshots()
+
+        with self.assertNumQueries(1):
+            ranking = get_ranking("protein_powder", "concentrate")
+        self.assertEqual(ranking[0][0]["formatted_price"], "20.00€")
+
+        response = self.client.get(reverse("supplements:protein_powders"))
+        self.assertContains(response, "20.00€")
+        self.assertContains(response, "Shop")
+
+    def test_unchanged_rankings_keep_their_update_time(self):
+        """
+        Rebuilding only moves updated_at for slices whose content changed.
+        """
+        brand = create_brand()
+        powder = create_protein_powder(brand, "20.00")
+        rebuild_ranking_snapshots()
+        before = dict(RankingSnapshot.objects.values_list("type", "updated_at"))
+
+        powder.price = "18.00"
+        powder.save()
+        rebuild_ranking_snapshots()
+        after = dict(RankingSnapshot.objects.values_list("type", "updated_at"))
+
+        self.assertGreater(after["concentrate"], before["concentrate"])
+        self.assertEqual(after["isolate"], before["isolate"])
+
+    def test_rebuild_without_changes_keeps_the_catalog_version(self):
+        """
+        Rebuilding when no slice changed leaves the catalog version alone.
+        """
+        create_protein_powder(create_brand(), "20.00")
+        rebuild_ranking_snapshots()
+        version = catalog_version()
+
+        rebuild_ranking_snapshots()
+
+        self.assertEqual(catalog_version(), version)
+
+    def test_missing_snapshot_falls_back_to_live_ranking(self):
+        """
+        Before the first build, rankings are computed from the products.
+        """
+        create_creatine(create_brand(), "10.00")
+        self.assertEqual(get_ranking("creatine", "monohydrate", "powder")[0][0].formatted_price, "10.00€")
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        stats_counter.flush()
+        cache.clear()
+        brand = create_brand()
+        self.powder = create_protein_powder(brand, "20.00")
+        rebuild_ranking_snapshots()
+
+    def test_pages_are_served_from_cache_until_the_catalog_changes(self):
+        """
+        A repeated request is a cache hit with no queries, and bumping the
+        catalog version makes the next request render again.
+        """
+        url = reverse("supplements:protein_powders")
+        self.client.get(url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, "20.00€")
+        self.assertEqual(cache_stats()["page"], {"hit": 1, "miss": 1})
+
+        self.powder.price = "15.00"
+        self.powder.save()
+        rebuild_ranking_snapshots()
+
+        self.assertContains(self.client.get(url), "15.00€")
+        self.assertEqual(cache_stats()["page"], {"hit": 1, "miss": 2})
+
+    def test_cards_are_cached_as_fragments(self):
+        """
+        Ranking cards are cached per product under the catalog version, so
+        another page showing the same card reuses it.
+        """
+        self.client.get(reverse("supplements:protein_powders"))
+        self.client.get(reverse("supplements:protein_powders_by_type", args=["concentrate"]))
+
+        self.assertEqual(cache_stats()["fragment"], {"hit": 1, "miss": 1})
+
+    def test_counts_are_written_in_batches(self):
+        """
+        A hit is only added up in the process; the cache counter is written
+        when the batch is flushed, as cache_stats() does.
+        """
+        stats_counter.count("page", "hit")
+
+        self.assertIsNone(cache.get("catalog:stats:page:hit"))
+        self.assertEqual(cache_stats()["page"]["hit"], 1)
+
+    def test_stats_command_refuses_a_process_local_cache(self):
+        """
+        cache_stats would only ever show its own empty counters with the
+        local-memory cache, so it says so instead.
+        """
+        with self.assertRaisesMessage(CommandError, "CACHE_DIR"):
+            call_command("cache_stats", stdout=StringIO())
+
+    def test_price_writes_bump_the_version(self):
+        """
+        Writing a changed price moves the catalog to a new version.
+        """
+        before = catalog_version()
+        writer = PriceWriter()
+        writer.add(self.powder, "19.00")
+        writer.flush()
+
+        self.assertGreater(catalog_version(), before)
+        bump_catalog_version()
+        self.assertEqual(catalog_version(), before + 2)
+
+
+class ConditionalResponseTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        brand = create_brand()
+        create_protein_powder(brand, "20.00")
+        rebuild_ranking_snapshots()
+
+    def test_matching_etag_is_answered_without_rendering(self):
+        """
+        A request carrying the slice's current ETag gets a 304 without
+        touching the database.
+        """
+        url = reverse("supplements:protein_powders_by_type", args=["concentrate"])
+        response = self.client.get(url)
+        etag = response.headers["ETag"]
+        self.assertTrue(etag.startswith('"'))
+        self.assertIn("Last-Modified", response.headers)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes_only_with_its_slice(self):
+        """
+        A price change in one slice leaves the other slices' ETags alone.
+        """
+        concentrate = reverse("supplements:protein_powders_by_type", args=["concentrate"])
+        isolate = reverse("supplements:protein_powders_by_type", args=["isolate"])
+        before = (self.client.get(concentrate).headers["ETag"], self.client.get(isolate).headers["ETag"])
+
+        powder = ProteinPowder.objects.get()
+        powder.price = "18.00"
+        powder.save()
+        rebuild_ranking_snapshots()
+
+        self.assertNotEqual(self.client.get(concentrate).headers["ETag"], before[0])
+        self.assertEqual(self.client.get(isolate).headers["ETag"], before[1])
+
+
+class BenchmarkQueriesTests(TestCase):
+    def test_reports_every_query_and_leaves_no_rows_behind(self):
+        """
+        benchmark_queries times each query with and without the composite
+        indexes and rolls its synthetic catalog back.
+        """
+        out = StringIO()
+        call_command("benchmark_queries", rows=50, repeat=1, stdout=out)
+
+        self.assertIn("protein ranking:", out.getvalue())
+        self.assertIn("protein_ranking_idx", out.getvalue())
+        self.assertFalse(ProteinPowder.objects.exists())
+        self.assertFalse(Brand.objects.exists())
+
+
+class HtmlParserTests(SimpleTestCase):
+    page = (
+        "<html><head><script>var price = '<p class=\"price\">1,00€</p>';</script><style>p {}</style></head>"
+        "<body><!-- <p class='price'>2,00€</p> --><svg><text>icon</text></svg>"
+        "<div data-pid='7'><p class='price'>19,90 €</p></div></body></html>"
+    )
+
+    def test_subtree_drops_markup_no_selector_reads(self):
+        """
+        Scripts, styles, SVG and comments are left out of the parse, and the
+        price reads the same as on the whole page.
+        """
+        job = ScrapeJob("shop", "https://shop.pt/whey")
+        job.add_target(FakeProduct(job.url), "div[data-pid='7'] p.price")
+        subtree = HtmlParser("html.parser", subtree=True)
+
+        self.assertEqual(read_prices(self.page, job, subtree), [Decimal("19.90")])
+        self.assertEqual(read_prices(self.page, job, HtmlParser("html.parser", subtree=False)), [Decimal("19.90")])
+        self.assertNotIn("icon", subtree.parse(self.page).text("body"))
+
+    def test_custom_elements_named_like_dropped_tags_are_kept(self):
+        """
+        Hyphenated custom elements such as <svg-icon> are not mistaken for
+        the tags whose content is dropped.
+        """
+        page = (
+            "<svg-icon name='cart'></svg-icon><template-slot><p class='price'>24,90€</p></template-slot>"
+            "<svg><path/></svg><template><p>x</p></template>"
+        )
+        job = ScrapeJob("shop", "https://shop.pt/whey")
+        job.add_target(FakeProduct(job.url), "template-slot p.price")
+
+        self.assertEqual(read_prices(page, job, HtmlParser("html.parser")), [Decimal("24.90")])
+
+    def test_unknown_backend_is_rejected(self):
+        """
+        Asking for a parser that does not exist fails before any page is
+        loaded.
+        """
+        with self.assertRaises(ImproperlyConfigured):
+            HtmlParser("regex")
+
+
+class PriceParsingTests(SimpleTestCase):
+    def test_reads_locale_formats_into_decimals(self):
+        """
+        Thousand separators, non-breaking spaces, promotions, per-unit prices
+        and discount badges all read as the product's price.
+        """
+        cases = {
+            "19,90 €": "19.90",
+            "1.299,90\xa0€": "1299.90",
+            "1\u202f299,90 €": "1299.90",
+            "de 39,90 € por 29,90 €": "29.90",
+            "29,90 € (14,95 €/kg) -20%": "29.90",
+            "€12.5": "12.50",
+        }
+        for text, price in cases.items():
+            with self.subTest(text=text):
+                self.assertEqual(parse_price(text), Decimal(price))
+        self.assertEqual(parse_price("1,299.90", locale="en"), Decimal("1299.90"))
+
+    def test_batch_reports_what_it_could_not_read(self):
+        """
+        Ranges, ambiguous or missing prices come back as errors in their
+        place in the batch, and missing texts as None.
+        """
+        results = parse_prices(["19,90 € - 29,90 €", "desde 9,90 €", "19,90 € 24,90 €", "esgotado", None, "9,90"])
+
+        self.assertTrue(all(isinstance(result, PriceFormatError) for result in results[:4]))
+        self.assertEqual(results[4:], [None, Decimal("9.90")])
+
+
+class PriceGuardTests(TestCase):
+    def test_outlier_is_written_only_once_seen_twice(self):
+        """
+        A price far from the last known one is held back, then accepted
+        when the next fetch reads it again; ordinary changes go through.
+        """
+        powder = create_protein_powder(create_brand(), "40.00")
+        state = RefreshState(product=powder)
+        guard = PriceGuard()
+
+        self.assertTrue(guard.check(powder, Decimal("36.00"), state))
+        self.assertFalse(guard.check(powder, Decimal("4.00"), state))
+        self.assertEqual(state.suspect_price, Decimal("4.00"))
+        self.assertTrue(guard.check(powder, Decimal("4.00"), state))
+        self.assertIsNone(state.suspect_price)
+        self.assertEqual((len(guard.held), guard.confirmed), (1, 1))
+
+
+class InBrowserExtractionTests(SimpleTestCase):
+    class Driver:
+        def __init__(self, texts):
+            self.texts = texts
+            self.scripts = []
+
+        @property
+        def page_source(self):
+            raise AssertionError("page_source should not be read")
+
+        def execute_script(self, script, *args):
+            self.scripts.append(script)
+            if script == SELENIUM_EXTRACT_SCRIPT:
+                return {key: self.texts.get(selector) for key, selector in args[0].items()}
+            return {"loaded": 1, "bytes": 1000, "blocked_images": 0}
+
+    def test_prices_are_read_inside_the_page(self):
+        """
+        Browser pages are read with a single extraction script per page,
+        without sending the rendered HTML back to be parsed.
+        """
+        plan = compile_plan({"shop": {"price_selector": "p"}})
+        job = ScrapeJob("shop", "https://shop.pt/whey")
+        job.add_target(FakeProduct(job.url), "p.small")
+        job.add_target(FakeProduct(job.url), "p.large")
+        job.add_target(FakeProduct(job.url), "p.gone")
+        session = mock.Mock(browser=self.Driver({"p.small": " 19,90 €", "p.large": "49,90€"}))
+
+        with mock.patch("supplements.management.commands.update_product_prices.selenium_open"):
+            prices = fetch_prices(session, job, FetchContext(plan))
+
+        self.assertEqual(prices, [Decimal("19.90"), Decimal("49.90"), None])
+        self.assertEqual(session.browser.scripts.count(SELENIUM_EXTRACT_SCRIPT), 1)
+
+
+class ReplayTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.store = PageStore(self.tmp.name)
+
+    def test_captured_page_replays_to_the_same_prices(self):
+        """
+        A page saved while fetching is stored under its page key and parses
+        to the same prices when replayed; other click states are not served.
+        """
+        plan = compile_plan({"shop": {"fetch": "http", "price_selector": "p.price"}})
+        job = ScrapeJob("shop", "https://shop.pt/whey")
+        job.add_target(FakeProduct(job.url), "p.price")
+        response = mock.Mock(text="<p class='price'>19,90€</p>", content=b"x")
+
+        with mock.patch("supplements.management.commands.update_product_prices.http_get", return_value=response):
+            fetched = fetch_prices(mock.Mock(), job, FetchContext(plan, capture=self.store))
+
+        (meta, html), = self.store.pages()
+        self.assertEqual((meta["url"], meta["price_selectors"]), (job.url, ["p.price"]))
+        self.assertEqual(ReplayFetcher(self.store)(ReplaySession(), job), fetched)
+        clicked = ScrapeJob("shop", job.url, click_selector="button")
+        clicked.add_target(FakeProduct(job.url), "p.price")
+        self.assertIsNone(self.store.load(clicked))
+
+    def test_benchmark_runs_the_pipeline_and_rolls_it_back(self):
+        """
+        benchmark_scraper reports parser cost per retailer and pipeline
+        throughput from captured pages, without keeping the new prices.
+        """
+        powder = create_protein_powder(create_brand(), "25.00")
+        registry = f"{self.tmp.name}/retailers.json"
+        with open(registry, "w") as f:
+            json.dump({"retailers": {"shop": {
+                "brand": "shop", "price_selector": "p.price",
+                "products": [{"weight": 1000, "variant": "concentrate"}],
+            }}}, f)
+        job = ScrapeJob("shop", powder.url)
+        job.add_target(powder, "p.price")
+        self.store.save(job, "<p class='price'>19,90€</p>")
+
+        out = StringIO()
+        call_command("benchmark_scraper", self.tmp.name, repeat=1, workers=1, registry=registry, stdout=out)
+
+        self.assertIn("shop: 1 pages", out.getvalue())
+        self.assertIn("Pipeline: 1 products (1 priced)", out.getvalue())
+        powder.refresh_from_db()
+        self.assertEqual(powder.price, Decimal("25.00"))
+
+
+class IndexViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_cheapest_per_kg_first_limited_to_twenty(self):
+        """
+        The home page lists the 20 protein powders with the lowest price per
+        kg, ordered and limited by the database.
+        """
+        brand = create_brand()
+        for i in range(25):
+            create_protein_powder(brand, f"{40 - i}.00", weight=1000 + i * 100)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("supplements:index"))
+
+        powders = response.context["protein_powder_list"]
+        self.assertEqual(len(powders), 20)
+        prices = [powder.price_per_kg for powder in powders]
+        self.assertEqual(prices, sorted(prices))
+        self.assertEqual(prices[0], ProteinPowder.objects.get(weight=3400).price_per_kg)
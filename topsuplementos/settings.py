@@ -85,6 +85,33 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Pages are cached per process by default, and so are the cache hit and miss
+# counters: manage.py cache_stats cannot see them. Point CACHE_DIR at a
+# directory to share one file-based cache, counters included, between the
+# web workers, the price updater and management commands.
+
+CACHE_DIR = os.environ.get('CACHE_DIR')
+
+if CACHE_DIR:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': CACHE_DIR,
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'topsuplementos',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -149,6 +176,12 @@ LOGGING = {
             'formatter': 'verbose',
         },
     },
+    'loggers': {
+        'supplements': {
+            'handlers': ['file'],
+            'level': 'INFO',
+        },
+    },
 }
 
 MEDIA_URL = '/media/'